@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+# Copyright (C) 2025 The Android Open Source Project
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Regenerates the prebuilt serialized trace fixtures.
+
+Serializes each tests/utils/*_trace.py fixture to tests/fixtures/<name>.pb
+together with a <name>.pb.sha sidecar recording the combined sha256 of
+the fixture source and the shared builder modules it is generated with.
+get_proto() only uses a blob whose sidecar matches those sources, so
+rerun this script after editing a fixture, trace_proto_builder.py or
+common_fixtures.py:
+
+$ python3 scripts/regen_metrics_fixtures.py
+"""
+
+import importlib
+import os
+import sys
+
+# Prefer the upb protobuf runtime for building the fixtures; protobuf
+# >= 4.21 no longer ships a cpp backend to fall back from.
+os.environ.setdefault("PROTOCOL_BUFFERS_PYTHON_IMPLEMENTATION", "upb")
+
+_TRACE_MODULES = [
+    "android_bitmap_metric_trace",
+    "android_dmabuf_per_process_metric_trace",
+    "android_gralloc_buffers_per_process_metric_trace",
+    "android_sf_critical_work_main_thread_trace",
+    "android_sf_critical_work_region_sampling_trace",
+]
+
+def main():
+    # Make metrics_specs importable when run from the scripts directory.
+    metrics_specs_root = os.path.dirname(
+        os.path.dirname(os.path.abspath(__file__)))
+    sys.path.insert(0, os.path.dirname(metrics_specs_root))
+
+    from metrics_specs.tests.utils import prebuilt_fixtures
+
+    for name in _TRACE_MODULES:
+        module = importlib.import_module(f"metrics_specs.tests.utils.{name}")
+        # Build from source, bypassing both the in-process cache and any
+        # existing prebuilt blob.
+        prebuilt_fixtures.store(name, module._build_proto())
+        print(f"regenerated {name}.pb")
+
+if __name__ == "__main__":
+    main()
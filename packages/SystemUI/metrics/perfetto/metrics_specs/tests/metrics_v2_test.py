@@ -13,6 +13,26 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+"""Tests for the v2 metric specs.
+
+The test classes are generated from _METRIC_CASES; each metric gets its
+own TestCase so that parallel runners (for example `pytest -n auto` with
+pytest-xdist) can distribute the trace_processor invocations, which
+dominate the wall-clock time of this suite. Adding a metric is one table
+row, given the usual naming scheme of <name>.textproto spec,
+<name>_output.txt expected output and <name>_<suffix> metric ids.
+"""
+
+import os
+import warnings
+
+# Prefer the upb protobuf runtime; the pure-Python fallback is an order
+# of magnitude slower at message construction and serialization, and upb
+# cascades cleanly to cpp/python on runtimes without it (protobuf >= 4.21
+# no longer ships the cpp backend and refuses to fall back from it).
+# Must be set before the first *_pb2 import below.
+os.environ.setdefault("PROTOCOL_BUFFERS_PYTHON_IMPLEMENTATION", "upb")
+
 from metrics_specs.tests.utils import android_bitmap_metric_trace
 from metrics_specs.tests.utils import android_sf_critical_work_main_thread_trace
 from metrics_specs.tests.utils import android_dmabuf_per_process_metric_trace
@@ -21,70 +41,80 @@ from metrics_specs.tests.utils import android_gralloc_buffers_per_process_metric
 from metrics_specs.tests.utils import test_helper
 import unittest
 
-class MetricsV2Test(unittest.TestCase):
+from google.protobuf.internal import api_implementation
+if api_implementation.Type() == "python":
+    warnings.warn(
+        "protobuf is running its pure-Python implementation; install the "
+        "protobuf package with the C++/upb extension for much faster trace "
+        "fixture construction.")
+
+# (test class name, metric name, fixture module, metric id suffixes)
+_METRIC_CASES = (
+    (
+        "BitmapMetricTest",
+        "android_bitmap_metric",
+        android_bitmap_metric_trace,
+        ("min_val", "max_val", "avg_val"),
+    ),
+    (
+        "SfCriticalWorkMainThreadMetricTest",
+        "android_sf_critical_work_main_thread",
+        android_sf_critical_work_main_thread_trace,
+        ("cuj_max_dur", "cuj_avg_dur", "cuj_count"),
+    ),
+    (
+        "DmabufPerProcessMetricTest",
+        "android_dmabuf_per_process_metric",
+        android_dmabuf_per_process_metric_trace,
+        ("min_val", "max_val", "avg_val"),
+    ),
+    (
+        "SfCriticalWorkRegionSamplingMetricTest",
+        "android_sf_critical_work_region_sampling",
+        android_sf_critical_work_region_sampling_trace,
+        ("cuj_max_dur", "cuj_avg_dur", "cuj_count"),
+    ),
+    (
+        "GrallocBuffersPerProcessMetricTest",
+        "android_gralloc_buffers_per_process_metric",
+        android_gralloc_buffers_per_process_metric_trace,
+        ("min_val", "max_val", "avg_val"),
+    ),
+)
+
+class MetricsV2TestBase(unittest.TestCase):
     def setUp(self):
         super().setUp()
         self.helper = test_helper.TestHelper(self)
 
-    def test_android_bitmap_metric(self):
-        self.helper.verify_metric(
-            spec_file="android_bitmap_metric.textproto",
-            trace_proto_bytes = android_bitmap_metric_trace.get_proto(),
-            expected_output_file = "android_bitmap_metric_output.txt",
-            metric_ids = [
-                "android_bitmap_metric_min_val",
-                "android_bitmap_metric_max_val",
-                "android_bitmap_metric_avg_val",
-            ]
-        )
-
-    def test_android_sf_critical_work_main_thread_metric(self):
-        self.helper.verify_metric(
-            spec_file="android_sf_critical_work_main_thread.textproto",
-            trace_proto_bytes = android_sf_critical_work_main_thread_trace.get_proto(),
-            expected_output_file = "android_sf_critical_work_main_thread_output.txt",
-            metric_ids = [
-                "android_sf_critical_work_main_thread_cuj_max_dur",
-                "android_sf_critical_work_main_thread_cuj_avg_dur",
-                "android_sf_critical_work_main_thread_cuj_count",
-            ]
-        )
-
-    def test_android_dmabuf_per_process_metric(self):
-        self.helper.verify_metric(
-            spec_file="android_dmabuf_per_process_metric.textproto",
-            trace_proto_bytes = android_dmabuf_per_process_metric_trace.get_proto(),
-            expected_output_file = "android_dmabuf_per_process_metric_output.txt",
-            metric_ids = [
-                "android_dmabuf_per_process_metric_min_val",
-                "android_dmabuf_per_process_metric_max_val",
-                "android_dmabuf_per_process_metric_avg_val",
-            ]
-        )
+def _test_name(metric_name):
+    # Keep the historical test method names, which all end in "_metric".
+    if metric_name.endswith("_metric"):
+        return f"test_{metric_name}"
+    return f"test_{metric_name}_metric"
 
-    def test_android_sf_critical_work_region_sampling_metric(self):
+def _make_test(metric_name, trace_module, metric_suffixes):
+    def test(self):
         self.helper.verify_metric(
-            spec_file="android_sf_critical_work_region_sampling.textproto",
-             trace_proto_bytes = android_sf_critical_work_region_sampling_trace.get_proto(),
-             expected_output_file = "android_sf_critical_work_region_sampling_output.txt",
-             metric_ids = [
-                 "android_sf_critical_work_region_sampling_cuj_max_dur",
-                 "android_sf_critical_work_region_sampling_cuj_avg_dur",
-                 "android_sf_critical_work_region_sampling_cuj_count",
-             ]
+            spec_file=f"{metric_name}.textproto",
+            trace_proto_bytes=trace_module.TRACE_PROTO_BYTES,
+            expected_output_file=f"{metric_name}_output.txt",
+            metric_ids=[f"{metric_name}_{suffix}" for suffix in metric_suffixes],
         )
+    test.__name__ = _test_name(metric_name)
+    test.__qualname__ = test.__name__
+    return test
 
-    def test_android_gralloc_buffers_per_process_metric(self):
-        self.helper.verify_metric(
-            spec_file="android_gralloc_buffers_per_process_metric.textproto",
-            trace_proto_bytes = android_gralloc_buffers_per_process_metric_trace.get_proto(),
-            expected_output_file = "android_gralloc_buffers_per_process_metric_output.txt",
-            metric_ids = [
-                "android_gralloc_buffers_per_process_metric_min_val",
-                "android_gralloc_buffers_per_process_metric_max_val",
-                "android_gralloc_buffers_per_process_metric_avg_val",
-            ]
-        )
+for _class_name, _metric_name, _trace_module, _metric_suffixes in _METRIC_CASES:
+    globals()[_class_name] = type(
+        _class_name,
+        (MetricsV2TestBase,),
+        {
+            _test_name(_metric_name): _make_test(
+                _metric_name, _trace_module, _metric_suffixes
+            )
+        },
+    )
 
 if __name__ == '__main__':
     unittest.main()
@@ -13,21 +13,39 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+from metrics_specs.tests.utils import prebuilt_fixtures
 from metrics_specs.tests.utils import trace_proto_builder
-from perfetto.protos.perfetto.trace.perfetto_trace_pb2 import Trace
+import functools
+import os
 
-def get_proto():
-    SYSUI_PID = 1000
-    SYSUI_PROCESS_NAME = "com.android.systemui"
+SYSUI_PID = 1000
+SYSUI_PROCESS_NAME = "com.android.systemui"
+
+LAUNCHER_PID = 2000
+LAUNCHER_PROCESS_NAME = "com.google.android.apps.nexuslauncher"
 
-    LAUNCHER_PID = 2000
-    LAUNCHER_PROCESS_NAME = "com.google.android.apps.nexuslauncher"
+THIRD_PROCESS_PID = 3000
+THIRD_PROCESS_NAME = "random_process"
 
-    THIRD_PROCESS_PID = 3000
-    THIRD_PROCESS_NAME = "random_process"
+# Counter events as (ts, pid, buf, cnt) rows; all events use tid == pid.
+_BITMAP_EVENTS: tuple[tuple[int, int, str, int], ...] = (
+    # Counters in the com.android.systemui process
+    (1000, SYSUI_PID, "Bitmap Count", 10),
+    (2000, SYSUI_PID, "Bitmap Count", 20),
+    (1000, SYSUI_PID, "Bitmap Memory", 100),
+    (2000, SYSUI_PID, "Bitmap Memory", 200),
+    (1000, SYSUI_PID, "Random Counter", 111),
+    # Counters in the com.google.android.apps.nexuslauncher process
+    (1500, LAUNCHER_PID, "Bitmap Count", 15),
+    (2500, LAUNCHER_PID, "Bitmap Count", 25),
+    (1500, LAUNCHER_PID, "Bitmap Memory", 150),
+    (2500, LAUNCHER_PID, "Bitmap Memory", 250),
+    # Counter in the third random process
+    (1000, THIRD_PROCESS_PID, "Bitmap Memory", 150),
+)
 
-    trace = Trace()
-    builder = trace_proto_builder.TraceProtoBuilder(trace)
+def _build_proto():
+    builder = trace_proto_builder.TraceProtoBuilder()
 
     # Add all processes
     builder.add_packet()
@@ -35,30 +53,38 @@ def get_proto():
     builder.add_process(pid=LAUNCHER_PID, ppid=LAUNCHER_PID, cmdline=LAUNCHER_PROCESS_NAME, uid=20001)
     builder.add_process(pid=THIRD_PROCESS_PID, ppid=THIRD_PROCESS_PID, cmdline=THIRD_PROCESS_NAME, uid=30001)
 
-    # Add counters in the com.android.systemui process
-    builder.add_ftrace_packet(cpu=0)
-    builder.add_atrace_counter(ts=1000, pid=SYSUI_PID, tid=SYSUI_PID, buf="Bitmap Count", cnt=10)
-    builder.add_ftrace_packet(cpu=0)
-    builder.add_atrace_counter(ts=2000, pid=SYSUI_PID, tid=SYSUI_PID, buf="Bitmap Count", cnt=20)
+    # All counter events share a single ftrace packet; an ftrace event bundle
+    # holds any number of events for a given cpu.
     builder.add_ftrace_packet(cpu=0)
-    builder.add_atrace_counter(ts=1000, pid=SYSUI_PID, tid=SYSUI_PID, buf="Bitmap Memory", cnt=100)
-    builder.add_ftrace_packet(cpu=0)
-    builder.add_atrace_counter(ts=2000, pid=SYSUI_PID, tid=SYSUI_PID, buf="Bitmap Memory", cnt=200)
-    builder.add_ftrace_packet(cpu=0)
-    builder.add_atrace_counter(ts=1000, pid=SYSUI_PID, tid=SYSUI_PID, buf="Random Counter", cnt=111)
 
-    # Add counters in the com.google.android.apps.nexuslauncher process
-    builder.add_ftrace_packet(cpu=0)
-    builder.add_atrace_counter(ts=1500, pid=LAUNCHER_PID, tid=LAUNCHER_PID, buf="Bitmap Count", cnt=15)
-    builder.add_ftrace_packet(cpu=0)
-    builder.add_atrace_counter(ts=2500, pid=LAUNCHER_PID, tid=LAUNCHER_PID, buf="Bitmap Count", cnt=25)
-    builder.add_ftrace_packet(cpu=0)
-    builder.add_atrace_counter(ts=1500, pid=LAUNCHER_PID, tid=LAUNCHER_PID, buf="Bitmap Memory", cnt=150)
-    builder.add_ftrace_packet(cpu=0)
-    builder.add_atrace_counter(ts=2500, pid=LAUNCHER_PID, tid=LAUNCHER_PID, buf="Bitmap Memory", cnt=250)
+    add_counter = builder.add_atrace_counter
+    for ts, pid, buf, cnt in _BITMAP_EVENTS:
+        add_counter(ts=ts, pid=pid, tid=pid, buf=buf, cnt=cnt)
 
-    # Add counter to third random process
-    builder.add_ftrace_packet(cpu=0)
-    builder.add_atrace_counter(ts=1000, pid=THIRD_PROCESS_PID, tid=THIRD_PROCESS_PID, buf="Bitmap Memory", cnt=150)
+    return builder.trace.SerializePartialToString()
+
+_cached_proto = functools.cache(_build_proto)
+
+def get_proto():
+    """Returns the serialized trace bytes.
+
+    Prefers a prebuilt tests/fixtures blob (see
+    scripts/regen_metrics_fixtures.py), otherwise builds the trace and
+    caches the bytes across repeated calls. Set METRICS_TEST_NO_CACHE=1
+    to rebuild the trace on every call.
+    """
+    if os.environ.get("METRICS_TEST_NO_CACHE") == "1":
+        return _build_proto()
+    prebuilt = prebuilt_fixtures.load(__name__)
+    if prebuilt is not None:
+        return prebuilt
+    return _cached_proto()
 
-    return builder.trace.SerializeToString()
\ No newline at end of file
+def __getattr__(name):
+    # PEP 562: materialize the serialized trace on first attribute access
+    # so importing the module stays cheap.
+    if name == "TRACE_PROTO_BYTES":
+        value = get_proto()
+        globals()[name] = value
+        return value
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -13,9 +13,47 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-from metrics_specs.tests.utils import trace_proto_builder
-from perfetto.protos.perfetto.trace.perfetto_trace_pb2 import Trace
+from metrics_specs.tests.utils import common_fixtures
+from metrics_specs.tests.utils import prebuilt_fixtures
 from typing import Optional
+import functools
+import itertools
+import os
+
+SYSUI_PID = 1000
+SYSUI_PROCESS_NAME = "com.android.systemui"
+
+SYSTEM_SERVER_PID = 2000
+SYSTEM_SERVER_PROCESS_NAME = "system_server"
+
+GRALLOC_PID = 4000
+GRALLOC_PROCESS_NAME = "/vendor/bin/hw/android.hardware.graphics.allocator"
+
+RANDOM_PROCESS_PID = 5000
+RANDOM_PROCESS_NAME = "random_process"
+
+INODE = 1111
+
+# Simulated DMA-buf events as (size, pid, ts_delta, binder_duration) rows.
+# Each event's timestamp is the running sum of the preceding ts_deltas and
+# its total_allocated counter is the running sum of sizes; a non-None
+# binder_duration additionally emits a sysui->pid binder transaction for
+# attribution. Growing the stress fixture is a matter of appending rows.
+_DMABUF_EVENTS: tuple[tuple[int, int, int, Optional[int]], ...] = (
+    # Process 1: Multiple allocations
+    (1024, SYSUI_PID, 1000, None),
+    # Gralloc Allocation, with binder attribution
+    (2048, GRALLOC_PID, 1500, 50),
+    (-1024, SYSUI_PID, 500, None),
+    (512, SYSUI_PID, 2000, None),
+    # Process 2: Allocation and free
+    (8192, SYSTEM_SERVER_PID, 1000, None),
+    (-8192, SYSTEM_SERVER_PID, 500, None),
+    # Random process allocation, should not be tracked
+    (256, RANDOM_PROCESS_PID, 500, None),
+    # Gralloc release, with binder attribution
+    (-2048, GRALLOC_PID, 500, 20),
+)
 
 def add_dmabuf_alloc_event(builder, ts: int, buf_size: int, tid: int, inode: int, total_allocated: int):
     """Adds a dma_heap_stat event as an ftrace_event."""
@@ -27,91 +65,58 @@ def add_dmabuf_alloc_event(builder, ts: int, buf_size: int, tid: int, inode: int
     dma_heap_stat.total_allocated = total_allocated
 
 def add_binder_transaction_events(builder, ts_start: int, duration: int, client_tid: int, server_tid: int, flow_id: int):
-    reply_ts_start = ts_start + int(duration/2)
+    reply_ts_start = ts_start + (duration >> 1)
     reply_ts_end = ts_start + duration
     transaction_id = flow_id
     reply_id = flow_id + 1000
     builder.add_binder_transaction(transaction_id, ts_start, ts_start + duration, client_tid, client_tid, reply_id, reply_ts_start, reply_ts_end, server_tid, server_tid)
 
-def add_process(builder, package_name: str, uid: int, pid: int):
-  builder.add_package_list(ts=0, name=package_name, uid=uid, version_code=1)
-  builder.add_process(pid=pid, ppid=pid, cmdline=package_name, uid=uid)
-  builder.add_thread(tid=pid, tgid=pid, cmdline="MainThread", name="MainThread")
-
-def get_proto():
-    SYSUI_PID = 1000
-    SYSUI_PROCESS_NAME = "com.android.systemui"
-
-    SYSTEM_SERVER_PID = 2000
-    SYSTEM_SERVER_PROCESS_NAME = "system_server"
-
-    GRALLOC_PID = 4000
-    GRALLOC_PROCESS_NAME = "/vendor/bin/hw/android.hardware.graphics.allocator"
-
-    RANDOM_PROCESS_PID = 5000
-    RANDOM_PROCESS_NAME = "random_process"
-
-    INODE = 1111
-
-    trace = Trace()
-    builder = trace_proto_builder.TraceProtoBuilder(trace)
-
-    # Add a generic packet, this is needed to add the processes and threads
-    builder.add_packet()
-
-    # Add processes
-    add_process(builder, package_name=SYSUI_PROCESS_NAME, uid=10001, pid=SYSUI_PID)
-    add_process(builder, package_name=SYSTEM_SERVER_PROCESS_NAME, uid=20001, pid=SYSTEM_SERVER_PID)
-    add_process(builder, package_name=GRALLOC_PROCESS_NAME, uid=40001, pid=GRALLOC_PID)
-    add_process(builder, package_name=RANDOM_PROCESS_NAME, uid=50001, pid=RANDOM_PROCESS_PID)
-
-    # Add ftrace packet
-    builder.add_ftrace_packet(cpu=0)
-
+def _build_proto():
+    # Processes, threads and the shared ftrace packet.
+    builder = common_fixtures.make_builder_with_processes(
+        (SYSUI_PROCESS_NAME, 10001, SYSUI_PID),
+        (SYSTEM_SERVER_PROCESS_NAME, 20001, SYSTEM_SERVER_PID),
+        (GRALLOC_PROCESS_NAME, 40001, GRALLOC_PID),
+        (RANDOM_PROCESS_NAME, 50001, RANDOM_PROCESS_PID),
+    )
+
+    # Simulate DMABuf events, some with binder attribution. The running
+    # total_allocated values are the cumulative sum of the event sizes.
     current_ts = 0
     flow_id_counter = 1
-    total_allocated = 0
-
-    # Simulate DMABuf events, some with binder attribution
-    # Process 1: Multiple allocations
-    total_allocated += 1024
-    add_dmabuf_alloc_event(builder, current_ts, 1024, SYSUI_PID, INODE, total_allocated)
-    current_ts += 1000
-
-    # Gralloc Allocation, with binder attribution
-    total_allocated += 2048
-    add_dmabuf_alloc_event(builder, current_ts, 2048, GRALLOC_PID, INODE, total_allocated)
-    add_binder_transaction_events(builder, current_ts, 50, SYSUI_PID, GRALLOC_PID, flow_id_counter)
-    flow_id_counter += 1
-    current_ts += 1500
+    totals = itertools.accumulate(row[0] for row in _DMABUF_EVENTS)
+    for (size, pid, ts_delta, binder_duration), total in zip(_DMABUF_EVENTS, totals):
+        add_dmabuf_alloc_event(builder, current_ts, size, pid, INODE, total)
+        if binder_duration is not None:
+            add_binder_transaction_events(
+                builder, current_ts, binder_duration, SYSUI_PID, pid, flow_id_counter)
+            flow_id_counter += 1
+        current_ts += ts_delta
 
-    total_allocated -= 1024
-    add_dmabuf_alloc_event(builder, current_ts, -1024, SYSUI_PID, INODE, total_allocated)
-    current_ts += 500
+    return builder.trace.SerializePartialToString()
 
-    total_allocated += 512
-    add_dmabuf_alloc_event(builder, current_ts, 512, SYSUI_PID, INODE, total_allocated)
-    current_ts += 2000
+_cached_proto = functools.cache(_build_proto)
 
-    # Process 2: Allocation and free
-    total_allocated += 8192
-    add_dmabuf_alloc_event(builder, current_ts, 8192, SYSTEM_SERVER_PID, INODE, total_allocated)
-    current_ts += 1000
-
-    total_allocated -= 8192
-    add_dmabuf_alloc_event(builder, current_ts, -8192, SYSTEM_SERVER_PID, INODE, total_allocated)
-    current_ts += 500
-
-    # Random process allocation, should not be tracked
-    total_allocated += 256
-    add_dmabuf_alloc_event(builder, current_ts, 256, RANDOM_PROCESS_PID, INODE, total_allocated)
-    current_ts += 500
-
-    # Gralloc release, with binder attribution
-    total_allocated -= 2048
-    add_dmabuf_alloc_event(builder, current_ts, -2048, GRALLOC_PID, INODE, total_allocated)
-    add_binder_transaction_events(builder, current_ts, 20, SYSUI_PID, GRALLOC_PID, flow_id_counter)
-    flow_id_counter += 1
-    current_ts += 500
-
-    return builder.trace.SerializeToString()
\ No newline at end of file
+def get_proto():
+    """Returns the serialized trace bytes.
+
+    Prefers a prebuilt tests/fixtures blob (see
+    scripts/regen_metrics_fixtures.py), otherwise builds the trace and
+    caches the bytes across repeated calls. Set METRICS_TEST_NO_CACHE=1
+    to rebuild the trace on every call.
+    """
+    if os.environ.get("METRICS_TEST_NO_CACHE") == "1":
+        return _build_proto()
+    prebuilt = prebuilt_fixtures.load(__name__)
+    if prebuilt is not None:
+        return prebuilt
+    return _cached_proto()
+
+def __getattr__(name):
+    # PEP 562: materialize the serialized trace on first attribute access
+    # so importing the module stays cheap.
+    if name == "TRACE_PROTO_BYTES":
+        value = get_proto()
+        globals()[name] = value
+        return value
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
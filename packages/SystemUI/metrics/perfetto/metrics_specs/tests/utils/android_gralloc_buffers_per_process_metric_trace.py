@@ -13,36 +13,62 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+from metrics_specs.tests.utils import prebuilt_fixtures
 from metrics_specs.tests.utils import trace_proto_builder
-from perfetto.protos.perfetto.trace.perfetto_trace_pb2 import Trace
+import functools
+import os
 
-def get_proto():
+def _build_proto():
     SYSUI_PID = 1000
     SYSUI_PROCESS_NAME = "com.android.systemui"
 
     LAUNCHER_PID = 2000
     LAUNCHER_PROCESS_NAME = "com.google.android.apps.nexuslauncher"
 
-    trace = Trace()
-    builder = trace_proto_builder.TraceProtoBuilder(trace)
+    builder = trace_proto_builder.TraceProtoBuilder()
 
     # Add all processes
     builder.add_packet()
     builder.add_process(pid=SYSUI_PID, ppid=SYSUI_PID, cmdline=SYSUI_PROCESS_NAME, uid=10001)
     builder.add_process(pid=LAUNCHER_PID, ppid=LAUNCHER_PID, cmdline=LAUNCHER_PROCESS_NAME, uid=20001)
 
-    # Add counters in the com.android.systemui process
+    # All counter events share a single ftrace packet; an ftrace event bundle
+    # holds any number of events for a given cpu.
     builder.add_ftrace_packet(cpu=0)
+
+    # Add counters in the com.android.systemui process
     builder.add_atrace_counter(ts=1000, pid=SYSUI_PID, tid=SYSUI_PID, buf="mem.gralloc.buffers", cnt=10)
-    builder.add_ftrace_packet(cpu=0)
     builder.add_atrace_counter(ts=2000, pid=SYSUI_PID, tid=SYSUI_PID, buf="mem.gralloc.buffers", cnt=20)
-    builder.add_ftrace_packet(cpu=0)
     builder.add_atrace_counter(ts=1000, pid=SYSUI_PID, tid=SYSUI_PID, buf="Random Counter", cnt=111)
 
     # Add counters in the com.google.android.apps.nexuslauncher process
-    builder.add_ftrace_packet(cpu=0)
     builder.add_atrace_counter(ts=1500, pid=LAUNCHER_PID, tid=LAUNCHER_PID, buf="mem.gralloc.buffers", cnt=15)
-    builder.add_ftrace_packet(cpu=0)
     builder.add_atrace_counter(ts=2500, pid=LAUNCHER_PID, tid=LAUNCHER_PID, buf="mem.gralloc.buffers", cnt=25)
 
-    return builder.trace.SerializeToString()
\ No newline at end of file
+    return builder.trace.SerializePartialToString()
+
+_cached_proto = functools.cache(_build_proto)
+
+def get_proto():
+    """Returns the serialized trace bytes.
+
+    Prefers a prebuilt tests/fixtures blob (see
+    scripts/regen_metrics_fixtures.py), otherwise builds the trace and
+    caches the bytes across repeated calls. Set METRICS_TEST_NO_CACHE=1
+    to rebuild the trace on every call.
+    """
+    if os.environ.get("METRICS_TEST_NO_CACHE") == "1":
+        return _build_proto()
+    prebuilt = prebuilt_fixtures.load(__name__)
+    if prebuilt is not None:
+        return prebuilt
+    return _cached_proto()
+
+def __getattr__(name):
+    # PEP 562: materialize the serialized trace on first attribute access
+    # so importing the module stays cheap.
+    if name == "TRACE_PROTO_BYTES":
+        value = get_proto()
+        globals()[name] = value
+        return value
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -13,8 +13,11 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-from metrics_specs.tests.utils import trace_proto_builder
-from perfetto.protos.perfetto.trace.perfetto_trace_pb2 import Trace
+from metrics_specs.tests.utils import common_fixtures
+from metrics_specs.tests.utils import prebuilt_fixtures
+import functools
+import os
+import sys
 
 SYSUI_PID = 5000
 SYSUI_UI_TID = 5020
@@ -23,9 +26,9 @@ SF_TID = 6020
 RANDOM_PROCESS_PID = 7000
 RANDOM_PROCESS_TID = 7020
 
-SYSUI_PACKAGE = "com.android.systemui"
-SF_PACKAGE = "/system/bin/surfaceflinger"
-RANDOM_PROCESS_PACKAGE = "random_process"
+SYSUI_PACKAGE = sys.intern("com.android.systemui")
+SF_PACKAGE = sys.intern("/system/bin/surfaceflinger")
+RANDOM_PROCESS_PACKAGE = sys.intern("random_process")
 
 SYSUI_UID = 10001
 SF_UID = 10002
@@ -42,20 +45,54 @@ TRACK_NAME_2 = "random_track"
 TRACK_ID_2 = 500
 TRACK_ID_3 = 600
 
-COMMIT_SLICE = "Commit"
-COMPOSITION_SLICE = "Composition"
-POST_COMPOSITION_SLICE = "Post Composition"
-TRANSACTIONAL_HANDLING_SLICE = "Transaction Handling"
-REFRESH_RATE_SELECTION_SLICE = "Refresh Rate Selection"
-
-LAYER_1 = "TX - first_layer#0"
+COMMIT_SLICE = sys.intern("Commit")
+COMPOSITION_SLICE = sys.intern("Composition")
+POST_COMPOSITION_SLICE = sys.intern("Post Composition")
+TRANSACTIONAL_HANDLING_SLICE = sys.intern("Transaction Handling")
+REFRESH_RATE_SELECTION_SLICE = sys.intern("Refresh Rate Selection")
+
+LAYER_1 = sys.intern("TX - first_layer#0")
+
+TRUSTED_SEQUENCE_ID = 100
+
+# Track event slices as (name, ts, dur) rows, keyed by track id.
+_SLICES_BY_TRACK: tuple[tuple[int, tuple[tuple[str, int, int], ...]], ...] = (
+    # Slices within cuj duration on the CriticalWorkload track in SF process
+    (TRACK_ID_1, (
+        (COMMIT_SLICE, 27_000_000, 12_000_000),
+        (TRANSACTIONAL_HANDLING_SLICE, 27_500_000, 5_000_000),
+        (REFRESH_RATE_SELECTION_SLICE, 34_000_000, 3_000_000),
+        (COMPOSITION_SLICE, 39_000_000, 4_000_000),
+        (POST_COMPOSITION_SLICE, 43_000_000, 3_000_000),
+        (COMMIT_SLICE, 84_000_000, 2_000_000),
+        (COMPOSITION_SLICE, 86_000_000, 3_000_000),
+        # Post Composition slice outside the CUJ duration ( should not be tracked )
+        (POST_COMPOSITION_SLICE, 89_000_000, 3_000_000),
+    )),
+    # Slices on the random track ( should not be tracked )
+    (TRACK_ID_2, (
+        (COMMIT_SLICE, 27_000_000, 12_000_000),
+    )),
+    # Slices within cuj duration on the CriticalWorkload track in random
+    # process ( should not be tracked )
+    (TRACK_ID_3, (
+        (COMMIT_SLICE, 27_000_000, 12_000_000),
+    )),
+)
+
+# Expected and actual surface frames as (ts, expected_dur, actual_dur, token).
+_FRAMES: tuple[tuple[int, int, int, int], ...] = (
+    (27_000_000, 16_000_000, 7_000_000, 20),
+    (44_000_000, 16_000_000, 7_000_000, 22),
+    (61_000_000, 16_000_000, 6_000_000, 24),
+    (84_000_000, 10_000_000, 6_000_000, 65),
+)
 
 def setup_trace():
-    trace = trace_proto_builder.TraceProtoBuilder(Trace())
-    add_process(trace, package_name=SYSUI_PACKAGE, uid=SYSUI_UID, pid=SYSUI_PID)
-    add_process(trace, package_name=SF_PACKAGE, uid=SF_UID, pid=SF_PID)
-    trace.add_ftrace_packet(cpu=0)
-    return trace
+    return common_fixtures.make_builder_with_processes(
+        (SYSUI_PACKAGE, SYSUI_UID, SYSUI_PID),
+        (SF_PACKAGE, SF_UID, SF_PID),
+    )
 
 def add_slices_and_track(trace):
     # Add CriticalWorkload and a random track to the SF process
@@ -71,77 +108,6 @@ def add_slices_and_track(trace):
         pid=SF_PID,
         process_name=SF_PACKAGE,
     )
-
-    # Add slices within cuj duration to the CriticalWorkload track in SF process
-    trace.add_track_event_slice(
-        name=COMMIT_SLICE,
-        ts=27_000_000,
-        dur=12_000_000,
-        track=TRACK_ID_1,
-        trusted_sequence_id=100,
-    )
-    trace.add_track_event_slice(
-        name=TRANSACTIONAL_HANDLING_SLICE,
-        ts=27_500_000,
-        dur=5_000_000,
-        track=TRACK_ID_1,
-        trusted_sequence_id=100,
-    )
-    trace.add_track_event_slice(
-        name=REFRESH_RATE_SELECTION_SLICE,
-        ts=34_000_000,
-        dur=3_000_000,
-        track=TRACK_ID_1,
-        trusted_sequence_id=100,
-    )
-    trace.add_track_event_slice(
-        name=COMPOSITION_SLICE,
-        ts=39_000_000,
-        dur=4_000_000,
-        track=TRACK_ID_1,
-        trusted_sequence_id=100,
-    )
-    trace.add_track_event_slice(
-        name=POST_COMPOSITION_SLICE,
-        ts=43_000_000,
-        dur=3_000_000,
-        track=TRACK_ID_1,
-        trusted_sequence_id=100,
-    )
-
-    trace.add_track_event_slice(
-        name=COMMIT_SLICE,
-        ts=84_000_000,
-        dur=2_000_000,
-        track=TRACK_ID_1,
-        trusted_sequence_id=100,
-    )
-    trace.add_track_event_slice(
-        name=COMPOSITION_SLICE,
-        ts=86_000_000,
-        dur=3_000_000,
-        track=TRACK_ID_1,
-        trusted_sequence_id=100,
-    )
-
-    # Add Post Composition slice outside the CUJ duration ( should not be tracked )
-    trace.add_track_event_slice(
-        name=POST_COMPOSITION_SLICE,
-        ts=89_000_000,
-        dur=3_000_000,
-        track=TRACK_ID_1,
-        trusted_sequence_id=100,
-    )
-
-    # Add slices to the random track ( should not be tracked)
-    trace.add_track_event_slice(
-        name=COMMIT_SLICE,
-        ts=27_000_000,
-        dur=12_000_000,
-        track=TRACK_ID_2,
-        trusted_sequence_id=100,
-    )
-
     # Add CriticalWorkload track to the random process
     trace.add_process_track_descriptor(
         process_track=TRACK_ID_3,
@@ -150,22 +116,20 @@ def add_slices_and_track(trace):
         process_name=RANDOM_PROCESS_PACKAGE,
     )
 
-    # Add slices within cuj duration to the CriticalWorkload track in random process ( should not be tracked )
-    trace.add_track_event_slice(
-        name=COMMIT_SLICE,
-        ts=27_000_000,
-        dur=12_000_000,
-        track=TRACK_ID_3,
-        trusted_sequence_id=100,
-    )
+    # Emit all slices from the per-track tables.
+    add_slice = trace.add_track_event_slice
+    for track, slices in _SLICES_BY_TRACK:
+        for name, ts, dur in slices:
+            add_slice(
+                name=name,
+                ts=ts,
+                dur=dur,
+                track=track,
+                trusted_sequence_id=TRUSTED_SEQUENCE_ID,
+            )
     return trace
 
 
-def add_process(trace, package_name, uid, pid):
-    trace.add_package_list(ts=0, name=package_name, uid=uid, version_code=1)
-    trace.add_process(pid=pid, ppid=pid, cmdline=package_name, uid=uid)
-    trace.add_thread(tid=pid, tgid=pid, cmdline="MainThread", name="MainThread")
-
 def add_expected_surface_frame_events(trace, ts, dur, token, pid):
     trace.add_expected_surface_frame_start_event(
         ts=ts,
@@ -197,7 +161,14 @@ def add_actual_surface_frame_events(trace, ts, dur, token, layer, pid):
 def add_cuj(trace, cuj_name):
     # Add 2 CUJs in the trace with the specified cuj_name.
 
-    trace.add_async_atrace_for_thread(
+    # Bind the builder methods once; add_cuj calls them ~20 times.
+    add_async_atrace_for_thread = trace.add_async_atrace_for_thread
+    add_atrace_instant = trace.add_atrace_instant
+    add_atrace_instant_for_track = trace.add_atrace_instant_for_track
+    add_atrace_for_thread = trace.add_atrace_for_thread
+    add_frame = trace.add_frame
+
+    add_async_atrace_for_thread(
         ts=25_000_000,
         ts_end=77_000_000,
         buf=cuj_name,
@@ -205,7 +176,7 @@ def add_cuj(trace, cuj_name):
         tid=SYSUI_UI_TID,
     )
 
-    trace.add_async_atrace_for_thread(
+    add_async_atrace_for_thread(
         ts=83_000_000,
         ts_end=102_000_000,
         buf=cuj_name,
@@ -213,21 +184,21 @@ def add_cuj(trace, cuj_name):
         tid=SYSUI_UI_TID,
     )
 
-    trace.add_atrace_instant(
+    add_atrace_instant(
         ts=25_000_001,
         buf=cuj_name + "#UIThread",
         pid=SYSUI_PID,
         tid=SYSUI_UI_TID,
     )
 
-    trace.add_atrace_instant(
+    add_atrace_instant(
         ts=83_000_001,
         buf=cuj_name + "#UIThread",
         pid=SYSUI_PID,
         tid=SYSUI_UI_TID,
     )
 
-    trace.add_atrace_instant_for_track(
+    add_atrace_instant_for_track(
         ts=25_000_001,
         buf="FT#beginVsync#20",
         pid=SYSUI_PID,
@@ -235,7 +206,7 @@ def add_cuj(trace, cuj_name):
         track_name=cuj_name,
     )
 
-    trace.add_atrace_instant_for_track(
+    add_atrace_instant_for_track(
         ts=25_000_010,
         buf="FT#layerId#0",
         pid=SYSUI_PID,
@@ -243,7 +214,7 @@ def add_cuj(trace, cuj_name):
         track_name=cuj_name,
     )
 
-    trace.add_atrace_instant_for_track(
+    add_atrace_instant_for_track(
         ts=76_000_001,
         buf="FT#endVsync#30",
         pid=SYSUI_PID,
@@ -251,7 +222,7 @@ def add_cuj(trace, cuj_name):
         track_name=cuj_name,
     )
 
-    trace.add_atrace_instant_for_track(
+    add_atrace_instant_for_track(
         ts=83_000_001,
         buf="FT#beginVsync#65",
         pid=SYSUI_PID,
@@ -259,7 +230,7 @@ def add_cuj(trace, cuj_name):
         track_name=cuj_name,
     )
 
-    trace.add_atrace_instant_for_track(
+    add_atrace_instant_for_track(
         ts=83_000_010,
         buf="FT#layerId#0",
         pid=SYSUI_PID,
@@ -267,7 +238,7 @@ def add_cuj(trace, cuj_name):
         track_name=cuj_name,
     )
 
-    trace.add_atrace_instant_for_track(
+    add_atrace_instant_for_track(
         ts=101_000_001,
         buf="FT#endVsync#70",
         pid=SYSUI_PID,
@@ -276,7 +247,7 @@ def add_cuj(trace, cuj_name):
     )
 
     # Add Choreographer#doFrame slices within CUJ boundary.
-    trace.add_frame(
+    add_frame(
         vsync=20,
         ts_do_frame=26_000_000,
         ts_end_do_frame=32_000_000,
@@ -284,7 +255,7 @@ def add_cuj(trace, cuj_name):
         pid=SYSUI_PID,
     )
 
-    trace.add_atrace_for_thread(
+    add_atrace_for_thread(
         ts=27_000_000,
         ts_end=28_000_000,
         buf="DrawFrames 20",
@@ -292,7 +263,7 @@ def add_cuj(trace, cuj_name):
         pid=SYSUI_PID,
     )
 
-    trace.add_frame(
+    add_frame(
         vsync=22,
         ts_do_frame=43_000_000,
         ts_end_do_frame=49_000_000,
@@ -300,7 +271,7 @@ def add_cuj(trace, cuj_name):
         pid=SYSUI_PID,
     )
 
-    trace.add_atrace_for_thread(
+    add_atrace_for_thread(
         ts=44_000_000,
         ts_end=45_000_000,
         buf="DrawFrames 22",
@@ -308,7 +279,7 @@ def add_cuj(trace, cuj_name):
         pid=SYSUI_PID,
     )
 
-    trace.add_frame(
+    add_frame(
         vsync=24,
         ts_do_frame=60_000_000,
         ts_end_do_frame=65_000_000,
@@ -316,7 +287,7 @@ def add_cuj(trace, cuj_name):
         pid=SYSUI_PID,
     )
 
-    trace.add_atrace_for_thread(
+    add_atrace_for_thread(
         ts=61_000_000,
         ts_end=62_000_000,
         buf="DrawFrames 24",
@@ -324,7 +295,7 @@ def add_cuj(trace, cuj_name):
         pid=SYSUI_PID,
     )
 
-    trace.add_frame(
+    add_frame(
         vsync=65,
         ts_do_frame=84_000_000,
         ts_end_do_frame=89_000_000,
@@ -332,7 +303,7 @@ def add_cuj(trace, cuj_name):
         pid=SYSUI_PID,
     )
 
-    trace.add_atrace_for_thread(
+    add_atrace_for_thread(
         ts=85_000_000,
         ts_end=86_000_000,
         buf="DrawFrames 65",
@@ -341,56 +312,50 @@ def add_cuj(trace, cuj_name):
     )
 
     # Add expected and actual frames.
-    add_expected_surface_frame_events(
-        trace, ts=27_000_000, dur=16_000_000, token=20, pid=SYSUI_PID
-    )
-    add_actual_surface_frame_events(
-        trace,
-        ts=27_000_000,
-        dur=7_000_000,
-        token=20,
-        layer=LAYER_1,
-        pid=SYSUI_PID,
-    )
-
-    add_expected_surface_frame_events(
-        trace, ts=44_000_000, dur=16_000_000, token=22, pid=SYSUI_PID
-    )
-    add_actual_surface_frame_events(
-        trace,
-        ts=44_000_000,
-        dur=7_000_000,
-        token=22,
-        layer=LAYER_1,
-        pid=SYSUI_PID,
-    )
-
-    add_expected_surface_frame_events(
-        trace, ts=61_000_000, dur=16_000_000, token=24, pid=SYSUI_PID
-    )
-    add_actual_surface_frame_events(
-        trace,
-        ts=61_000_000,
-        dur=6_000_000,
-        token=24,
-        layer=LAYER_1,
-        pid=SYSUI_PID,
-    )
-
-    add_expected_surface_frame_events(
-        trace, ts=84_000_000, dur=10_000_000, token=65, pid=SYSUI_PID
-    )
-    add_actual_surface_frame_events(
-        trace,
-        ts=84_000_000,
-        dur=6_000_000,
-        token=65,
-        layer=LAYER_1,
-        pid=SYSUI_PID,
-    )
-
-def get_proto():
+    for ts, expected_dur, actual_dur, token in _FRAMES:
+        add_expected_surface_frame_events(
+            trace, ts=ts, dur=expected_dur, token=token, pid=SYSUI_PID
+        )
+        add_actual_surface_frame_events(
+            trace,
+            ts=ts,
+            dur=actual_dur,
+            token=token,
+            layer=LAYER_1,
+            pid=SYSUI_PID,
+        )
+
+def _build_proto():
     trace = setup_trace()
     add_cuj(trace, FIRST_CUJ)
     builder = add_slices_and_track(trace)
-    return builder.trace.SerializeToString()
+    return builder.trace.SerializePartialToString()
+
+# The cache lives on the serialized bytes rather than on the intermediate
+# setup_trace/add_cuj/add_slices_and_track steps so the Trace message itself
+# can be garbage collected after the first build.
+_cached_proto = functools.cache(_build_proto)
+
+def get_proto():
+    """Returns the serialized trace bytes.
+
+    Prefers a prebuilt tests/fixtures blob (see
+    scripts/regen_metrics_fixtures.py), otherwise builds the trace and
+    caches the bytes across repeated calls. Set METRICS_TEST_NO_CACHE=1
+    to rebuild the trace on every call.
+    """
+    if os.environ.get("METRICS_TEST_NO_CACHE") == "1":
+        return _build_proto()
+    prebuilt = prebuilt_fixtures.load(__name__)
+    if prebuilt is not None:
+        return prebuilt
+    return _cached_proto()
+
+def __getattr__(name):
+    # PEP 562: materialize the serialized trace on first attribute access
+    # so importing the module stays cheap.
+    if name == "TRACE_PROTO_BYTES":
+        value = get_proto()
+        globals()[name] = value
+        return value
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
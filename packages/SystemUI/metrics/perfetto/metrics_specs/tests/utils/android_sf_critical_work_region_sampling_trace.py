@@ -13,8 +13,15 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-from metrics_specs.tests.utils import trace_proto_builder
-from perfetto.protos.perfetto.trace.perfetto_trace_pb2 import Trace
+from metrics_specs.tests.utils import common_fixtures
+from metrics_specs.tests.utils import prebuilt_fixtures
+import functools
+import os
+
+# The perfetto_trace_pb2 descriptor tree is deliberately not imported
+# here; the builder is obtained through common_fixtures, so importing
+# this module for its serialized bytes stays cheap.
+__all__ = ["TRACE_PROTO_BYTES", "get_proto"]
 
 SF_PID = 6000
 SF_TID_1 = 6020
@@ -32,6 +39,8 @@ SYSUI_RTID = 1555
 
 FIRST_CUJ = "J<FIRST_CUJ>"
 SECOND_CUJ = "J<SECOND_CUJ>"
+FIRST_CUJ_UI_MARKER = FIRST_CUJ + "#UIThread"
+SECOND_CUJ_UI_MARKER = SECOND_CUJ + "#UIThread"
 
 RENDER_ENGINE_TRACK_NAME = "RenderEngine"
 REGION_SAMPLING_TRACK_NAME = "RegionSampling"
@@ -46,12 +55,48 @@ WAIT_FOREVER_SLICE = "waitForever"
 
 LAYER_1 = "TX - first_layer#0"
 
+TRUSTED_SEQUENCE_ID = 100
+
+# Choreographer frames and their companion events as (vsync, ts_do_frame,
+# ts_end_do_frame, draw_ts, draw_ts_end, surface_ts, expected_dur,
+# actual_dur) rows; the vsync count doubles as the surface frame token.
+_FRAMES: tuple[tuple[int, int, int, int, int, int, int, int], ...] = (
+    (20, 26_000_000, 32_000_000, 27_000_000, 28_000_000,
+     27_000_000, 16_000_000, 7_000_000),
+    (22, 43_000_000, 49_000_000, 44_000_000, 45_000_000,
+     44_000_000, 16_000_000, 7_000_000),
+    (24, 60_000_000, 75_000_000, 61_000_000, 62_000_000,
+     61_000_000, 16_000_000, 6_000_000),
+    (65, 84_000_000, 89_000_000, 85_000_000, 86_000_000,
+     84_000_000, 10_000_000, 6_000_000),
+    (68, 96_000_000, 102_000_000, 97_000_000, 98_000_000,
+     96_000_000, 10_000_000, 6_000_000),
+    (70, 107_000_000, 112_000_000, 107_000_000, 108_000_000,
+     107_000_000, 10_000_000, 6_000_000),
+)
+
+# Track event slices as (name, ts, dur, track) rows.
+_SLICES: tuple[tuple[str, int, int, int], ...] = (
+    # During the first CUJ: 2 instances of drawLayers on the render engine
+    # thread and waitForever on the regionSampling thread.
+    (MAIN_SLICE_RENDER_ENGINE, 27_000_000, 12_000_000, THREAD_TRACK_1),
+    (INTERNAL_SLICE_RENDER_ENGINE, 27_500_000, 11_500_000, THREAD_TRACK_1),
+    (WAIT_FOREVER_SLICE, 39_500_000, 10_000_000, THREAD_TRACK_2),
+    (MAIN_SLICE_RENDER_ENGINE, 55_000_000, 12_000_000, THREAD_TRACK_1),
+    (INTERNAL_SLICE_RENDER_ENGINE, 55_500_000, 11_500_000, THREAD_TRACK_1),
+    (WAIT_FOREVER_SLICE, 67_500_000, 14_000_000, THREAD_TRACK_2),
+    # During the second CUJ: drawLayers on the render engine thread and
+    # waitForever on the regionSampling thread.
+    (MAIN_SLICE_RENDER_ENGINE, 86_000_000, 12_000_000, THREAD_TRACK_1),
+    (INTERNAL_SLICE_RENDER_ENGINE, 86_500_000, 11_500_000, THREAD_TRACK_1),
+    (WAIT_FOREVER_SLICE, 98_500_000, 14_000_000, THREAD_TRACK_2),
+)
+
 def setup_trace():
-    trace = trace_proto_builder.TraceProtoBuilder(Trace())
-    add_process(trace, package_name=SYSUI_PACKAGE, uid=SYSUI_UID, pid=SYSUI_PID)
-    add_process(trace, package_name=SF_PACKAGE, uid=SF_UID, pid=SF_PID)
-    trace.add_ftrace_packet(cpu=0)
-    return trace
+    return common_fixtures.make_builder_with_processes(
+        (SYSUI_PACKAGE, SYSUI_UID, SYSUI_PID),
+        (SF_PACKAGE, SF_UID, SF_PID),
+    )
 
 def add_slices_and_track(trace):
     # Add RenderEngine and a RegionSampling track to the SF process through 2 separate threads
@@ -82,114 +127,42 @@ def add_slices_and_track(trace):
         thread_name=REGION_SAMPLING_TRACK_NAME,
     )
 
-    # Add 2 instances of drawLayers slice to the render engine thread and waitForever slice to the regionSampling thread during first CUJ duration.
-    trace.add_track_event_slice(
-        name=MAIN_SLICE_RENDER_ENGINE,
-        ts=27_000_000,
-        dur=12_000_000,
-        track=THREAD_TRACK_1,
-        trusted_sequence_id=100,
-    )
-    trace.add_track_event_slice(
-        name=INTERNAL_SLICE_RENDER_ENGINE,
-        ts=27_500_000,
-        dur=11_500_000,
-        track=THREAD_TRACK_1,
-        trusted_sequence_id=100,
-    )
-    trace.add_track_event_slice(
-        name=WAIT_FOREVER_SLICE,
-        ts=39_500_000,
-        dur=10_000_000,
-        track=THREAD_TRACK_2,
-        trusted_sequence_id=100,
-    )
-
-    trace.add_track_event_slice(
-        name=MAIN_SLICE_RENDER_ENGINE,
-        ts=55_000_000,
-        dur=12_000_000,
-        track=THREAD_TRACK_1,
-        trusted_sequence_id=100,
-    )
-    trace.add_track_event_slice(
-        name=INTERNAL_SLICE_RENDER_ENGINE,
-        ts=55_500_000,
-        dur=11_500_000,
-        track=THREAD_TRACK_1,
-        trusted_sequence_id=100,
-    )
-    trace.add_track_event_slice(
-        name=WAIT_FOREVER_SLICE,
-        ts=67_500_000,
-        dur=14_000_000,
-        track=THREAD_TRACK_2,
-        trusted_sequence_id=100,
-    )
-
-    # Add drawLayers slice to the render engine thread and waitForever slice to the regionSampling thread during second CUJ duration.
-    trace.add_track_event_slice(
-        name=MAIN_SLICE_RENDER_ENGINE,
-        ts=86_000_000,
-        dur=12_000_000,
-        track=THREAD_TRACK_1,
-        trusted_sequence_id=100,
-    )
-    trace.add_track_event_slice(
-        name=INTERNAL_SLICE_RENDER_ENGINE,
-        ts=86_500_000,
-        dur=11_500_000,
-        track=THREAD_TRACK_1,
-        trusted_sequence_id=100,
-    )
-    trace.add_track_event_slice(
-        name=WAIT_FOREVER_SLICE,
-        ts=98_500_000,
-        dur=14_000_000,
-        track=THREAD_TRACK_2,
-        trusted_sequence_id=100,
-    )
+    # Emit all slices from the table.
+    add_slice = trace.add_track_event_slice
+    for name, ts, dur, track in _SLICES:
+        add_slice(
+            name=name,
+            ts=ts,
+            dur=dur,
+            track=track,
+            trusted_sequence_id=TRUSTED_SEQUENCE_ID,
+        )
     return trace
 
-def add_process(trace, package_name, uid, pid):
-    trace.add_package_list(ts=0, name=package_name, uid=uid, version_code=1)
-    trace.add_process(pid=pid, ppid=pid, cmdline=package_name, uid=uid)
-    trace.add_thread(tid=pid, tgid=pid, cmdline="MainThread", name="MainThread")
+# The builder calls below are positional, following the signatures
+# (ts, cookie, token, display_frame_token, pid, layer_name[,
+# present_type, on_time_finish, gpu_composition, jank_type,
+# prediction_type]); this skips the kwargs dict CPython builds for
+# keyword calls, which adds up across the frames emitted per CUJ.
 
-def add_expected_surface_frame_events(trace, ts, dur, token, pid):
+def add_expected_surface_frame_events(trace, ts: int, dur: int, token: int, pid: int):
+    cookie = 100000 + token
     trace.add_expected_surface_frame_start_event(
-        ts=ts,
-        cookie=100000 + token,
-        token=token,
-        display_frame_token=100 + token,
-        pid=pid,
-        layer_name="",
-    )
-    trace.add_frame_end_event(ts=ts + dur, cookie=100000 + token)
+        ts, cookie, token, 100 + token, pid, "")
+    trace.add_frame_end_event(ts + dur, cookie)
 
-def add_actual_surface_frame_events(trace, ts, dur, token, layer, pid):
-    cookie = token + 1
+def add_actual_surface_frame_events(trace, ts: int, dur: int, token: int, layer: str, pid: int):
+    cookie = 100002 + token + 1
     trace.add_actual_surface_frame_start_event(
-        ts=ts,
-        cookie=100002 + cookie,
-        token=token,
-        display_frame_token=token + 100,
-        pid=pid,
-        present_type=1,
-        on_time_finish=1,
-        gpu_composition=0,
-        jank_type=1,
-        prediction_type=3,
-        layer_name=layer,
-    )
-    trace.add_frame_end_event(ts=ts + dur, cookie=100002 + cookie)
+        ts, cookie, token, token + 100, pid, layer, 1, 1, 0, 1, 3)
+    trace.add_frame_end_event(ts + dur, cookie)
 
-def add_cujs(trace, cuj_name_1, cuj_name_2):
-    # add 2 new CUJs with specified names in trace.
+def add_cujs(trace):
+    # Add the 2 CUJs (FIRST_CUJ and SECOND_CUJ) to the trace.
     trace.add_async_atrace_for_thread(
         ts=25_000_000,
         ts_end=77_000_000,
-        buf=cuj_name_1,
+        buf=FIRST_CUJ,
         pid=SYSUI_PID,
         tid=SYSUI_UI_TID,
     )
@@ -197,21 +170,21 @@ def add_cujs(trace, cuj_name_1, cuj_name_2):
     trace.add_async_atrace_for_thread(
         ts=83_000_000,
         ts_end=120_000_000,
-        buf=cuj_name_2,
+        buf=SECOND_CUJ,
         pid=SYSUI_PID,
         tid=SYSUI_UI_TID,
     )
 
     trace.add_atrace_instant(
         ts=25_000_001,
-        buf=cuj_name_1 + "#UIThread",
+        buf=FIRST_CUJ_UI_MARKER,
         pid=SYSUI_PID,
         tid=SYSUI_UI_TID,
     )
 
     trace.add_atrace_instant(
         ts=83_000_001,
-        buf=cuj_name_2 + "#UIThread",
+        buf=SECOND_CUJ_UI_MARKER,
         pid=SYSUI_PID,
         tid=SYSUI_UI_TID,
     )
@@ -221,7 +194,7 @@ def add_cujs(trace, cuj_name_1, cuj_name_2):
         buf="FT#beginVsync#20",
         pid=SYSUI_PID,
         tid=SYSUI_UI_TID,
-        track_name=cuj_name_1,
+        track_name=FIRST_CUJ,
     )
 
     trace.add_atrace_instant_for_track(
@@ -229,7 +202,7 @@ def add_cujs(trace, cuj_name_1, cuj_name_2):
         buf="FT#layerId#0",
         pid=SYSUI_PID,
         tid=SYSUI_UI_TID,
-        track_name=cuj_name_1,
+        track_name=FIRST_CUJ,
     )
 
     trace.add_atrace_instant_for_track(
@@ -237,7 +210,7 @@ def add_cujs(trace, cuj_name_1, cuj_name_2):
         buf="FT#endVsync#30",
         pid=SYSUI_PID,
         tid=SYSUI_UI_TID,
-        track_name=cuj_name_1,
+        track_name=FIRST_CUJ,
     )
 
     trace.add_atrace_instant_for_track(
@@ -245,7 +218,7 @@ def add_cujs(trace, cuj_name_1, cuj_name_2):
         buf="FT#beginVsync#65",
         pid=SYSUI_PID,
         tid=SYSUI_UI_TID,
-        track_name=cuj_name_2,
+        track_name=SECOND_CUJ,
     )
 
     trace.add_atrace_instant_for_track(
@@ -253,7 +226,7 @@ def add_cujs(trace, cuj_name_1, cuj_name_2):
         buf="FT#layerId#0",
         pid=SYSUI_PID,
         tid=SYSUI_UI_TID,
-        track_name=cuj_name_2,
+        track_name=SECOND_CUJ,
     )
 
     trace.add_atrace_instant_for_track(
@@ -261,181 +234,69 @@ def add_cujs(trace, cuj_name_1, cuj_name_2):
         buf="FT#endVsync#70",
         pid=SYSUI_PID,
         tid=SYSUI_UI_TID,
-        track_name=cuj_name_2,
-    )
-
-    # Add Choreographer#doFrame slices within CUJ boundary.
-    trace.add_frame(
-        vsync=20,
-        ts_do_frame=26_000_000,
-        ts_end_do_frame=32_000_000,
-        tid=SYSUI_UI_TID,
-        pid=SYSUI_PID,
-    )
-
-    trace.add_atrace_for_thread(
-        ts=27_000_000,
-        ts_end=28_000_000,
-        buf="DrawFrames 20",
-        tid=SYSUI_RTID,
-        pid=SYSUI_PID,
-    )
-
-    trace.add_frame(
-        vsync=22,
-        ts_do_frame=43_000_000,
-        ts_end_do_frame=49_000_000,
-        tid=SYSUI_UI_TID,
-        pid=SYSUI_PID,
-    )
-
-    trace.add_atrace_for_thread(
-        ts=44_000_000,
-        ts_end=45_000_000,
-        buf="DrawFrames 22",
-        tid=SYSUI_RTID,
-        pid=SYSUI_PID,
-    )
-
-    trace.add_frame(
-        vsync=24,
-        ts_do_frame=60_000_000,
-        ts_end_do_frame=75_000_000,
-        tid=SYSUI_UI_TID,
-        pid=SYSUI_PID,
-    )
-
-    trace.add_atrace_for_thread(
-        ts=61_000_000,
-        ts_end=62_000_000,
-        buf="DrawFrames 24",
-        tid=SYSUI_RTID,
-        pid=SYSUI_PID,
-    )
-
-    trace.add_frame(
-        vsync=65,
-        ts_do_frame=84_000_000,
-        ts_end_do_frame=89_000_000,
-        tid=SYSUI_UI_TID,
-        pid=SYSUI_PID,
-    )
-
-    trace.add_atrace_for_thread(
-        ts=85_000_000,
-        ts_end=86_000_000,
-        buf="DrawFrames 65",
-        tid=SYSUI_RTID,
-        pid=SYSUI_PID,
-    )
-
-    trace.add_frame(
-        vsync=68,
-        ts_do_frame=96_000_000,
-        ts_end_do_frame=102_000_000,
-        tid=SYSUI_UI_TID,
-        pid=SYSUI_PID,
-    )
-
-    trace.add_atrace_for_thread(
-        ts=97_000_000,
-        ts_end=98_000_000,
-        buf="DrawFrames 68",
-        tid=SYSUI_RTID,
-        pid=SYSUI_PID,
-    )
-
-    trace.add_frame(
-        vsync=70,
-        ts_do_frame=107_000_000,
-        ts_end_do_frame=112_000_000,
-        tid=SYSUI_UI_TID,
-        pid=SYSUI_PID,
-    )
-
-    trace.add_atrace_for_thread(
-        ts=107_000_000,
-        ts_end=108_000_000,
-        buf="DrawFrames 70",
-        tid=SYSUI_RTID,
-        pid=SYSUI_PID,
-    )
-
-    # Add expected and actual frames.
-    add_expected_surface_frame_events(
-        trace, ts=27_000_000, dur=16_000_000, token=20, pid=SYSUI_PID
-    )
-    add_actual_surface_frame_events(
-        trace,
-        ts=27_000_000,
-        dur=7_000_000,
-        token=20,
-        layer=LAYER_1,
-        pid=SYSUI_PID,
-    )
-
-    add_expected_surface_frame_events(
-        trace, ts=44_000_000, dur=16_000_000, token=22, pid=SYSUI_PID
-    )
-    add_actual_surface_frame_events(
-        trace,
-        ts=44_000_000,
-        dur=7_000_000,
-        token=22,
-        layer=LAYER_1,
-        pid=SYSUI_PID,
-    )
-
-    add_expected_surface_frame_events(
-        trace, ts=61_000_000, dur=16_000_000, token=24, pid=SYSUI_PID
-    )
-    add_actual_surface_frame_events(
-        trace,
-        ts=61_000_000,
-        dur=6_000_000,
-        token=24,
-        layer=LAYER_1,
-        pid=SYSUI_PID,
-    )
-
-    add_expected_surface_frame_events(
-        trace, ts=84_000_000, dur=10_000_000, token=65, pid=SYSUI_PID
-    )
-    add_actual_surface_frame_events(
-        trace,
-        ts=84_000_000,
-        dur=6_000_000,
-        token=65,
-        layer=LAYER_1,
-        pid=SYSUI_PID,
-    )
-
-    add_expected_surface_frame_events(
-        trace, ts=96_000_000, dur=10_000_000, token=68, pid=SYSUI_PID
-    )
-    add_actual_surface_frame_events(
-        trace,
-        ts=96_000_000,
-        dur=6_000_000,
-        token=68,
-        layer=LAYER_1,
-        pid=SYSUI_PID,
-    )
+        track_name=SECOND_CUJ,
+    )
+
+    # Add Choreographer#doFrame slices within CUJ boundary, their
+    # DrawFrames render thread slices, and the expected and actual frames.
+    for (vsync, ts_do_frame, ts_end_do_frame, draw_ts, draw_ts_end,
+         surface_ts, expected_dur, actual_dur) in _FRAMES:
+        trace.add_frame(
+            vsync=vsync,
+            ts_do_frame=ts_do_frame,
+            ts_end_do_frame=ts_end_do_frame,
+            tid=SYSUI_UI_TID,
+            pid=SYSUI_PID,
+        )
+
+        trace.add_atrace_for_thread(
+            ts=draw_ts,
+            ts_end=draw_ts_end,
+            buf=f"DrawFrames {vsync}",
+            tid=SYSUI_RTID,
+            pid=SYSUI_PID,
+        )
+
+        add_expected_surface_frame_events(
+            trace, ts=surface_ts, dur=expected_dur, token=vsync, pid=SYSUI_PID
+        )
+        add_actual_surface_frame_events(
+            trace,
+            ts=surface_ts,
+            dur=actual_dur,
+            token=vsync,
+            layer=LAYER_1,
+            pid=SYSUI_PID,
+        )
+
+def _build_proto():
+    trace = setup_trace()
+    add_cujs(trace)
+    builder = add_slices_and_track(trace)
+    return builder.trace.SerializePartialToString()
 
-    add_expected_surface_frame_events(
-        trace, ts=107_000_000, dur=10_000_000, token=70, pid=SYSUI_PID
-    )
-    add_actual_surface_frame_events(
-        trace,
-        ts=107_000_000,
-        dur=6_000_000,
-        token=70,
-        layer=LAYER_1,
-        pid=SYSUI_PID,
-    )
+_cached_proto = functools.cache(_build_proto)
 
 def get_proto():
-    trace = setup_trace()
-    add_cujs(trace, FIRST_CUJ, SECOND_CUJ)
-    builder = add_slices_and_track(trace)
-    return builder.trace.SerializeToString()
+    """Returns the serialized trace bytes.
+
+    Prefers a prebuilt tests/fixtures blob (see
+    scripts/regen_metrics_fixtures.py), otherwise builds the trace and
+    caches the bytes across repeated calls. Set METRICS_TEST_NO_CACHE=1
+    to rebuild the trace on every call.
+    """
+    if os.environ.get("METRICS_TEST_NO_CACHE") == "1":
+        return _build_proto()
+    prebuilt = prebuilt_fixtures.load(__name__)
+    if prebuilt is not None:
+        return prebuilt
+    return _cached_proto()
+
+def __getattr__(name):
+    # PEP 562: materialize the serialized trace on first attribute access
+    # so importing the module stays cheap.
+    if name == "TRACE_PROTO_BYTES":
+        value = get_proto()
+        globals()[name] = value
+        return value
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,43 @@
+#!/usr/bin/env python3
+# Copyright (C) 2025 The Android Open Source Project
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Shared prelude helpers for the metric trace fixtures."""
+
+from metrics_specs.tests.utils import trace_proto_builder
+import sys
+
+# Interned once; reused for every thread the fixtures add.
+MAIN_THREAD_NAME = sys.intern("MainThread")
+
+def add_process(builder, package_name: str, uid: int, pid: int):
+    """Adds a package-list entry, a process and its MainThread thread."""
+    builder.add_package_list(ts=0, name=package_name, uid=uid, version_code=1)
+    builder.add_process(pid=pid, ppid=pid, cmdline=package_name, uid=uid)
+    builder.add_thread(
+        tid=pid, tgid=pid, cmdline=MAIN_THREAD_NAME, name=MAIN_THREAD_NAME)
+
+def make_builder_with_processes(*process_specs):
+    """Returns a builder with the common fixture prelude already emitted.
+
+    Each spec is a (package_name, uid, pid) triple. The returned builder
+    holds a generic packet with the process tree and an open ftrace packet
+    for cpu 0, ready for event emission.
+    """
+    builder = trace_proto_builder.TraceProtoBuilder()
+    builder.add_packet()
+    for package_name, uid, pid in process_specs:
+        add_process(builder, package_name=package_name, uid=uid, pid=pid)
+    builder.add_ftrace_packet(cpu=0)
+    return builder
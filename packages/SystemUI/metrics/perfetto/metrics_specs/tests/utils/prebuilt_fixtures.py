@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+# Copyright (C) 2025 The Android Open Source Project
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Loader for prebuilt serialized trace fixtures.
+
+scripts/regen_metrics_fixtures.py serializes each *_trace.py fixture to
+tests/fixtures/<module>.pb with a <module>.pb.sha sidecar recording the
+combined sha256 of every source the bytes are generated from: the
+fixture module itself plus the shared trace_proto_builder and
+common_fixtures modules. get_proto() in each fixture module prefers the
+prebuilt bytes when the sidecar still matches those sources, which
+skips proto construction and serialization entirely; a missing or
+stale sidecar, or a missing blob, silently falls back to building the
+trace in-process.
+
+The blobs make hand-written wire-format encoding of the fixtures
+unnecessary: once a blob exists, no serialization happens at test time
+at all, while the fixture sources stay ordinary protobuf-building code
+that tracks perfetto_trace.proto through the generated bindings.
+"""
+
+import hashlib
+import os
+
+_UTILS_DIR = os.path.dirname(os.path.abspath(__file__))
+_FIXTURES_DIR = os.path.join(os.path.dirname(_UTILS_DIR), "fixtures")
+
+# Modules every fixture's serialized bytes depend on, in addition to
+# the fixture module itself. Editing any of them must invalidate
+# existing blobs, so they all feed the sidecar hash.
+_SHARED_SOURCES = ("trace_proto_builder", "common_fixtures")
+
+def _source_hash(module_name: str) -> str:
+    digest = hashlib.sha256()
+    for name in _SHARED_SOURCES + (module_name,):
+        with open(os.path.join(_UTILS_DIR, name + ".py"), "rb") as f:
+            digest.update(f.read())
+    return digest.hexdigest()
+
+def load(module_name: str):
+    """Returns the prebuilt trace bytes for a fixture module, or None.
+
+    Args:
+        module_name: The fixture module name (a dotted name is reduced to
+          its last component).
+    """
+    module_name = module_name.rsplit(".", 1)[-1]
+    pb_path = os.path.join(_FIXTURES_DIR, module_name + ".pb")
+    try:
+        with open(pb_path + ".sha") as f:
+            recorded_hash = f.read().strip()
+        if recorded_hash != _source_hash(module_name):
+            # A generating source changed since the blob was written.
+            return None
+        with open(pb_path, "rb") as f:
+            return f.read()
+    except OSError:
+        # No sidecar, or a sidecar without its blob; build in-process.
+        return None
+
+def store(module_name: str, proto_bytes: bytes):
+    """Writes the prebuilt trace bytes and hash sidecar for a fixture module."""
+    module_name = module_name.rsplit(".", 1)[-1]
+    os.makedirs(_FIXTURES_DIR, exist_ok=True)
+    pb_path = os.path.join(_FIXTURES_DIR, module_name + ".pb")
+    with open(pb_path, "wb") as f:
+        f.write(proto_bytes)
+    with open(pb_path + ".sha", "w") as f:
+        f.write(_source_hash(module_name) + "\n")
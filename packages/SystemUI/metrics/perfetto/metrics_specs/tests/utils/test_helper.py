@@ -13,55 +13,141 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-from google.protobuf import text_format
+import os
+
+# Prefer the upb protobuf runtime; must be set before the first *_pb2
+# import pulled in below via the perfetto package. Older runtimes
+# cascade from upb to cpp/python, while protobuf >= 4.21 has no cpp
+# backend and would fail the import rather than fall back from it.
+os.environ.setdefault("PROTOCOL_BUFFERS_PYTHON_IMPLEMENTATION", "upb")
+
 from os.path import dirname as parent
-from perfetto.trace_processor import TraceProcessor,TraceProcessorConfig
+import atexit
+import functools
 import io
-import os
 import stat
 import unittest
 
+# google.protobuf and perfetto.trace_processor are imported lazily inside
+# the helpers below: they cost tens of milliseconds of descriptor and
+# C-extension loading, which test collection and suites that never call
+# verify_metric should not pay.
+
+_ROOT_DIRECTORY = parent(parent(parent(parent(os.path.abspath(__file__)))))
+
+@functools.cache
+def _trace_processor_config():
+    """Returns the TraceProcessorConfig, making the shell executable once."""
+    from perfetto.trace_processor import TraceProcessorConfig
+
+    shell_file = os.path.join(_ROOT_DIRECTORY, "trace_processor_shell")
+
+    current_mode = os.stat(shell_file).st_mode
+    # Add the executable bit for owner, group and others.
+    new_mode = current_mode | stat.S_IXUSR | stat.S_IXGRP | stat.S_IXOTH
+    os.chmod(shell_file, new_mode)
+
+    return TraceProcessorConfig(bin_path = shell_file)
+
+# Started processors keyed by trace bytes. The perfetto API binds a
+# processor to one trace at construction, so the instance is reused
+# whenever the same trace is verified again instead of spawning another
+# trace_processor_shell and re-ingesting the trace.
+_live_processors: dict[bytes, "TraceProcessor"] = {}
+
+def _trace_processor_for(trace_proto_bytes: bytes) -> "TraceProcessor":
+    """Returns a running TraceProcessor loaded with the given trace."""
+    from perfetto.trace_processor import TraceProcessor
+
+    tp = _live_processors.get(trace_proto_bytes)
+    if tp is None:
+        tp = TraceProcessor(
+            trace = io.BytesIO(trace_proto_bytes),
+            config = _trace_processor_config())
+        _live_processors[trace_proto_bytes] = tp
+    return tp
+
+@atexit.register
+def _close_processors():
+    for tp in _live_processors.values():
+        tp.close()
+    _live_processors.clear()
+
+@functools.cache
+def _read_file_version(path: str, mtime: float) -> str:
+    with open(path, 'r') as f:
+        return f.read()
+
+def _read_file(path: str) -> str:
+    """Reads a spec or expected-output file, memoized across tests.
+
+    Keyed on the file's mtime so that an edit mid-session (for example
+    while iterating on a spec under a long-lived test watcher) is picked
+    up instead of serving stale cached text.
+    """
+    return _read_file_version(path, os.path.getmtime(path))
+
 class TestHelper():
     """
     Helper class for metric tests.
 
     This class provides utility methods for verifying the output of a metric
     against a given output file.
+
+    The helper is process-safe but not thread-safe: the module-level
+    caches and the chmod of trace_processor_shell are unsynchronized, so
+    run tests concurrently with separate processes (for example
+    `pytest -n auto` under pytest-xdist, which the per-metric test
+    classes in metrics_v2_test.py are shaped for) rather than threads.
     """
     def __init__(self, test_case):
         self.test_case = test_case
 
-    def verify_metric(self, spec_file: str, trace_proto_bytes: str, expected_output_file: str, metric_ids: list[str]):
+    def verify_metric(self, spec_file: str, trace_proto_bytes: bytes, expected_output_file: str, metric_ids: list[str]):
         """
         Verifies the output of a metric against a given output file.
 
         Args:
             spec_file (str): The metric specification file.
-            trace_proto_bytes (str): The bytes of the trace proto.
+            trace_proto_bytes (bytes): The serialized trace proto.
             expected_output_file (str): The expected output file.
             metric_ids (list[str]): The list of metric ids.
         """
+        self.verify_metrics_multi(
+            trace_proto_bytes, [(spec_file, expected_output_file, metric_ids)])
 
-        root_directory = parent(parent(parent(parent(os.path.abspath(__file__)))))
+    def verify_metrics_multi(self, trace_proto_bytes: bytes, cases: list[tuple[str, str, list[str]]]):
+        """
+        Verifies several metrics against a single loaded trace.
 
-        spec_file_path = os.path.join(root_directory, spec_file)
-        expected_output_file_path = os.path.join(root_directory, "tests/data", expected_output_file)
-        shell_file = os.path.join(root_directory, "trace_processor_shell")
+        trace_processor is started and the trace is parsed once, then every
+        case is checked against it, amortizing the startup and ingestion
+        cost across all assertions that share a trace.
 
-        current_mode = os.stat(shell_file).st_mode
-        # Add the executable bit for owner, group and others.
-        new_mode = current_mode | stat.S_IXUSR | stat.S_IXGRP | stat.S_IXOTH
-        os.chmod(shell_file, new_mode)
+        Args:
+            trace_proto_bytes (bytes): The serialized trace proto.
+            cases: A list of (spec_file, expected_output_file, metric_ids)
+              tuples, with the same meaning as in verify_metric.
+        """
 
-        trace_config = TraceProcessorConfig(bin_path = shell_file)
+        from google.protobuf import text_format
 
-        with open(spec_file_path, 'r') as f:
-                    spec_text = f.read()
+        tp = _trace_processor_for(trace_proto_bytes)
+        for spec_file, expected_output_file, metric_ids in cases:
+            spec_text = _read_file(os.path.join(_ROOT_DIRECTORY, spec_file))
 
-        with TraceProcessor(trace = io.BytesIO(trace_proto_bytes), config = trace_config) as tp:
             summary = tp.trace_summary(specs=[spec_text], metric_ids=metric_ids)
-            trace_summary = text_format.MessageToString(summary)
 
-            with open(os.path.join(root_directory, expected_output_file_path), 'r') as f:
-                expected_output = f.read()
-                self.test_case.assertEqual(trace_summary, expected_output)
+            expected_output = _read_file(
+                os.path.join(_ROOT_DIRECTORY, "tests/data", expected_output_file))
+            # Compare at the proto level; field comparison short-circuits
+            # on the first difference and skips text rendering entirely on
+            # the passing path. The pretty text diff is built only when
+            # the summaries differ.
+            expected_summary = text_format.Parse(expected_output, type(summary)())
+            if summary != expected_summary:
+                self.test_case.assertEqual(
+                    text_format.MessageToString(summary), expected_output)
+                self.test_case.fail(
+                    f"Summary for {spec_file} does not match "
+                    f"{expected_output_file}")
@@ -15,72 +15,157 @@
 
 """Library for Ravenwood python scripts."""
 
+import concurrent.futures
 import csv
+import os
 import pathlib
 import re
-from typing import Callable
+from typing import Callable, Iterator
 
 Path = pathlib.Path
 
+_PACKAGE_RE = re.compile(r"^package\s+(.*)$", re.MULTILINE)
+
+_JAVA_CLASS_RE = re.compile(
+    r"^(?:(?:public|protected|private|abstract|static|final)\s+)*"
+    r"class\s+"
+    r"(\w+)",
+    re.MULTILINE,
+)
+
+_KT_CLASS_RE = re.compile(
+    r"^(?:(?:public|protected|private|internal|data|open|abstract|sealed)\s+)*"
+    r"class\s+"
+    r"(\w+)",
+    re.MULTILINE,
+)
+
+_CLASS_RE_BY_SUFFIX = {
+    ".java": _JAVA_CLASS_RE,
+    ".kt": _KT_CLASS_RE,
+}
+
 
 class SourceFile:
   """A Java or Kotlin source file."""
 
+  # Slots keep the per-instance footprint down; loaders create one
+  # SourceFile per file under the source root.
+  __slots__ = (
+      "path",
+      "modified",
+      "_text",
+      "_lines",
+      "_package",
+      "_class_idx_cache",
+  )
+
   path: Path
-  lines: list[str]
-  modified: bool = False
+  modified: bool
 
   def __init__(self, path: Path):
     self.path = path
+    self.modified = False
     with open(path, "r") as f:
-      self.lines = f.readlines()
+      self._text = f.read()
+    self._lines: list[str] | None = None
+    self._package: str | None = None
+    self._class_idx_cache: dict[str, int] = {}
+
+  @property
+  def lines(self) -> list[str | None]:
+    """The lines of the source file, split lazily on first access.
+
+    Scripts typically load a whole source tree but only ever inspect or
+    edit a handful of files, so the per-file line list is not built
+    until something actually asks for it.
+
+    A removed line is tombstoned to None rather than popped, keeping
+    removals O(1) and all other line indices stable; tombstones are
+    dropped when the file is written or rendered.
+    """
+    if self._lines is None:
+      self._lines = self._text.splitlines(keepends=True)
+    return self._lines
+
+  def _current_text(self) -> str:
+    """Returns the file content, reflecting any in-memory edits."""
+    if self._lines is None:
+      return self._text
+    return "".join(l for l in self._lines if l is not None)
 
   def get_package(self) -> str:
     """Returns the package name of the source file."""
-    for line in self.lines:
-      if line.startswith("package "):
-        return line.split(" ", 1)[1].strip()
-    return ""
+    if self._package is None:
+      text = self._current_text()
+      # The package statement sits right after the license header, so a
+      # bounded search covers virtually every file; rerun unbounded for
+      # the odd oversized preamble or a line cut off at the boundary.
+      match = _PACKAGE_RE.search(text, 0, 4096)
+      if match is None or match.end() >= 4096:
+        match = _PACKAGE_RE.search(text)
+      self._package = match.group(1).strip() if match else ""
+    return self._package
 
   def get_class_idx(self, class_name: str) -> int:
     """Returns the index of the class in the source file."""
     simple_class_name = class_name.split(".")[-1]
+    idx = self._class_idx_cache.get(simple_class_name)
+    if idx is not None:
+      return idx
+    needle = f"class {simple_class_name}"
     for idx, line in enumerate(self.lines):
-      if f"class {simple_class_name}" in line:
+      if line is not None and needle in line:
+        self._class_idx_cache[simple_class_name] = idx
         return idx
     return -1
 
+  def _shift_class_idx_cache(self, from_idx: int, delta: int):
+    """Adjusts cached class indices after a line insertion or removal."""
+    for name, idx in self._class_idx_cache.items():
+      if idx >= from_idx:
+        self._class_idx_cache[name] = idx + delta
+
   def list_classes(self) -> list[(str, int)]:
     """Finds the classes and their line numbers in the source file."""
-    if self.path.name.endswith(".java"):
-      pattern = re.compile(
-          r"^(?:(?:public|protected|private|abstract|static|final)\s+)*"
-          r"class\s+"
-          r"(\w+)"
-      )
-    elif self.path.name.endswith(".kt"):
-      pattern = re.compile(
-          r"^(?:(?:public|protected|private|internal|data|open|abstract|sealed)\s+)*"
-          r"class\s+"
-          r"(\w+)"
-      )
-    else:
+    pattern = _CLASS_RE_BY_SUFFIX.get(self.path.suffix)
+    if pattern is None:
       return []
 
+    # One multiline scan over the whole file keeps the matching inside
+    # the regex engine instead of a Python loop over every line. Matches
+    # come back in order, so the line index is tracked incrementally by
+    # counting the newlines between consecutive match starts.
+    text = self._current_text()
+    # The scan runs over the compacted text, but reported indices must
+    # live in the self.lines index space, where tombstoned lines still
+    # occupy slots; translate through the surviving-line positions when
+    # the file has been edited.
+    line_map = None
+    if self._lines is not None:
+      line_map = [i for i, l in enumerate(self._lines) if l is not None]
     results = []
     package = self.get_package()
-    for idx, line in enumerate(self.lines):
-      class_name = pattern.findall(line)
-      if class_name:
-        results.append((f"{package}.{class_name[0]}", idx))
+    idx = 0
+    scanned = 0
+    for match in pattern.finditer(text):
+      start = match.start()
+      idx += text.count("\n", scanned, start)
+      scanned = start
+      line_idx = line_map[idx] if line_map is not None else idx
+      simple_name = match.group(1)
+      # Seed the lookup cache so a later get_class_idx on a listed
+      # class is O(1) instead of another line scan.
+      self._class_idx_cache.setdefault(simple_name, line_idx)
+      results.append((f"{package}.{simple_name}", line_idx))
 
     return results
 
   def remove_import(self, class_name: str):
     """Removes an import statement from the source file."""
     for idx, line in enumerate(self.lines):
-      if line.startswith(f"import {class_name}"):
-        self.lines.pop(idx)
+      if line is not None and line.startswith(f"import {class_name}"):
+        self.lines[idx] = None
         self.modified = True
         return
 
@@ -89,7 +174,12 @@ class SourceFile:
     result = []
     curr_idx = class_idx - 1
     while True:
-      line = self.lines[curr_idx].strip()
+      line = self.lines[curr_idx]
+      if line is None:
+        # A tombstoned line; keep scanning upwards.
+        curr_idx -= 1
+        continue
+      line = line.strip()
       if line.startswith("@"):
         annotation_class = line[1:].split("(", 1)[0]
         result.append((annotation_class, curr_idx))
@@ -101,20 +191,46 @@ class SourceFile:
   def remove_annotation(self, class_name: str, annotation: str):
     """Removes an annotation (ignoring the package name) from the source file."""
     class_idx = self.get_class_idx(class_name)
+    simple_annotation = annotation.rsplit(".", 1)[-1]
     for annot, idx in self.list_annotations(class_idx):
-      if annot.split(".")[-1] == annotation.split(".")[-1]:
-        self.lines.pop(idx)
+      if annot.rsplit(".", 1)[-1] == simple_annotation:
+        self.lines[idx] = None
         self.modified = True
         break
 
+  def toggle_annotation(self, class_name: str, remove: str, add: str):
+    """Swaps one annotation for another in a single pass.
+
+    Removes `remove` and adds `add` (both matched on their simple names)
+    with one walk over the class's annotation block, where a
+    remove_annotation + add_annotation pair walks it twice.
+    """
+    class_idx = self.get_class_idx(class_name)
+    simple_remove = remove.rsplit(".", 1)[-1]
+    simple_add = add.rsplit(".", 1)[-1]
+    has_add = False
+    for annot, idx in self.list_annotations(class_idx):
+      simple_annot = annot.rsplit(".", 1)[-1]
+      if simple_annot == simple_remove:
+        self.lines[idx] = None
+        self.modified = True
+      elif simple_annot == simple_add:
+        has_add = True
+    if not has_add:
+      self.lines.insert(class_idx, f"@{add}\n")
+      self._shift_class_idx_cache(class_idx, 1)
+      self.modified = True
+
   def add_annotation(self, class_name: str, annotation: str):
     """Adds an annotation to the source file, if it doesn't have it already."""
     class_idx = self.get_class_idx(class_name)
+    simple_annotation = annotation.rsplit(".", 1)[-1]
     for annot, _ in self.list_annotations(class_idx):
-      if annot.split(".")[-1] == annotation.split(".")[-1]:
+      if annot.rsplit(".", 1)[-1] == simple_annotation:
         # The annotation is already present.
         return
     self.lines.insert(class_idx, f"@{annotation}\n")
+    self._shift_class_idx_cache(class_idx, 1)
     self.modified = True
 
   def write(self):
@@ -122,54 +238,78 @@ class SourceFile:
     if not self.modified:
       return
     with open(self.path, "w") as f:
-      f.writelines(self.lines)
+      f.writelines(l for l in self.lines if l is not None)
 
   def print(self):
     """Prints the source file."""
+    if self._lines is None:
+      print(self._text, end="")
+      return
     for line in self.lines:
-      print(line, end="")
+      if line is not None:
+        print(line, end="")
 
 
 def load_source_files(src_root: str) -> list[SourceFile]:
   """Loads all the source files from the given root directory."""
-  files = []
-  for java in Path(src_root).glob("**/*.java"):
-    files.append(SourceFile(java))
-  for kt in Path(src_root).glob("**/*.kt"):
-    files.append(SourceFile(kt))
-  return files
+  # A single os.walk visits each directory once for both suffixes,
+  # where the two recursive globs walked the whole tree twice.
+  paths = []
+  for dirpath, _, filenames in os.walk(src_root):
+    for name in filenames:
+      if name.endswith((".java", ".kt")):
+        paths.append(Path(dirpath, name))
+  # Loading is I/O-bound and read() releases the GIL, so a thread pool
+  # overlaps the per-file open/read latency. The result keeps the same
+  # order as the sequential version.
+  with concurrent.futures.ThreadPoolExecutor() as executor:
+    return list(executor.map(SourceFile, paths))
 
 
 def load_source_map(src_root: str) -> dict[str, SourceFile]:
   """Loads all the source files from the given root directory, and returns a map from class name to source file."""
-  files = load_source_files(src_root)
-  result = {}
-  for src in files:
-    for clazz, _ in src.list_classes():
-      result[clazz] = src
-  return result
+  return {
+      clazz: src
+      for src in load_source_files(src_root)
+      for clazz, _ in src.list_classes()
+  }
 
 
 def _find_tests(
-    csv_file: str, select_func: Callable[[[str]], bool]
-) -> list[str]:
-  """Finds all test classes from a test result CSV file."""
-  test = []
+    csv_file: str, select_func: Callable[[list[str], int, int], bool]
+) -> Iterator[str]:
+  """Yields the selected test classes from a test result CSV file.
+
+  select_func is called with each row plus the Failed and Skipped column
+  indices. Rows are plain lists from csv.reader; DictReader would build
+  a dict per row, which dominates parsing on large result files. Classes
+  are yielded as the rows stream by, so memory stays flat regardless of
+  the result file size.
+  """
   with open(csv_file) as f:
-    reader = csv.DictReader(f)
+    reader = csv.reader(f)
+    header = next(reader, None)
+    if header is None:
+      return
+    type_col = header.index("Type")
+    class_col = header.index("Class")
+    failed_col = header.index("Failed")
+    skipped_col = header.index("Skipped")
     for row in reader:
-      if row["Type"] == "c" and select_func(row):
-        test.append(row["Class"])
-  return test
+      if row[type_col] == "c" and select_func(row, failed_col, skipped_col):
+        yield row[class_col]
 
 
-def find_passed_tests(csv_file: str) -> list[str]:
-  """Finds all test classes that passed from a test result CSV file."""
+def find_passed_tests(csv_file: str) -> Iterator[str]:
+  """Yields the test classes that passed from a test result CSV file."""
+  # The counts are written as plain decimal, so comparing against "0"
+  # avoids two int() calls per row.
   return _find_tests(
-      csv_file, lambda row: int(row["Failed"]) == 0 and int(row["Skipped"]) == 0
+      csv_file,
+      lambda row, failed, skipped: row[failed] == "0" and row[skipped] == "0",
   )
 
 
-def find_failed_tests(csv_file: str) -> list[str]:
-  """Finds all test classes with at least one failure from a test result CSV file."""
-  return _find_tests(csv_file, lambda row: int(row["Failed"]) > 0)
+def find_failed_tests(csv_file: str) -> Iterator[str]:
+  """Yields the test classes with at least one failure from a test result CSV file."""
+  return _find_tests(csv_file, lambda row, failed, skipped: row[failed] != "0")
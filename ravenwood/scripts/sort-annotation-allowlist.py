@@ -22,6 +22,7 @@ Usage:
 $ python sort-annotation-allowlist.py /path/to/ravenwood-annotation-allowed-classes.txt
 """
 
+import collections
 import os
 import sys
 
@@ -33,7 +34,8 @@ with open(file_name) as f:
   lines = f.readlines()
 
 wildcards = set()
-pkg_dict = {}
+# Buckets of lines per package; sets dedupe repeated entries.
+pkg_dict = collections.defaultdict(set)
 
 for line in lines:
   line = line.strip()
@@ -45,23 +47,27 @@ for line in lines:
     wildcards.add(line)
     continue
   pkg = class_name.rsplit(".", 1)[0]
-  if pkg not in pkg_dict:
-    pkg_dict[pkg] = set()
   pkg_dict[pkg].add(line)
 
 
-with open(output_name, "w") as f:
-  print("# Only classes listed here can use the Ravenwood annotations. Keep the list alphabetically sorted.", file=f)
-  print("", file=f)
+out = [
+    "# Only classes listed here can use the Ravenwood annotations. Keep the list alphabetically sorted.",
+    "",
+]
+
+# Put wildcards first
+out.extend(sorted(wildcards))
 
-  # Put wildcards first
-  for wildcard in sorted(wildcards):
-    print(wildcard, file=f)
+# Then the classes, bundled by package
+for _, entries in sorted(pkg_dict.items()):
+  out.append("")
+  out.extend(sorted(entries))
 
-  # Then print classes, bundled by package
-  for pkg in sorted(pkg_dict.keys()):
-    print("", file=f)
-    for line in sorted(pkg_dict[pkg]):
-      print(line, file=f)
+# One buffered write instead of a print per line. The temp file lives
+# next to the allowlist, so the replace is an atomic same-filesystem
+# rename (and, unlike os.rename, also works on an existing target
+# everywhere).
+with open(output_name, "w") as f:
+  f.write("\n".join(out) + "\n")
 
-os.rename(output_name, file_name)
+os.replace(output_name, file_name)
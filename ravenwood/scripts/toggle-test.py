@@ -54,8 +54,7 @@ def enable_tests(src_root: str, csv_file: str):
       # Cannot find source for test
       continue
     src = test_sources[test_class]
-    src.remove_annotation(test_class, DISABLED_ANNOTATION)
-    src.add_annotation(test_class, ENABLED_ANNOTATION)
+    src.toggle_annotation(test_class, DISABLED_ANNOTATION, ENABLED_ANNOTATION)
     src.write()
 
 
@@ -67,8 +66,7 @@ def disable_tests(src_root: str, csv_file: str):
       # Cannot find source for test
       continue
     src = test_sources[test_class]
-    src.remove_annotation(test_class, ENABLED_ANNOTATION)
-    src.add_annotation(test_class, DISABLED_ANNOTATION)
+    src.toggle_annotation(test_class, ENABLED_ANNOTATION, DISABLED_ANNOTATION)
     src.write()
 
 
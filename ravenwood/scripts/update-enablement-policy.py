@@ -52,9 +52,16 @@ def load_policy(policy_file: str) -> dict[str, bool]:
 
 
 def write_policy(policy_file: str, policy: dict[str, bool]):
+  # The file on disk is always written sorted, so the dict from
+  # load_policy comes back almost-sorted and Timsort handles the re-sort
+  # in near-linear time even after a batch of mutations. writelines
+  # streams the generator into one buffered write loop instead of a
+  # write call per policy line.
   with open(policy_file, "w") as f:
-    for clazz, enabled in sorted(policy.items()):
-      f.write(f"{clazz} {str(enabled).lower()}\n")
+    f.writelines(
+        f"{clazz} {str(enabled).lower()}\n"
+        for clazz, enabled in sorted(policy.items())
+    )
 
 
 def enable_tests(policy_file: str, csv_file: str):
@@ -22,10 +22,19 @@
 # dot -Tpng -Gdpii=100 activity.dot -o activity.png
 
 import argparse
+import collections
+import concurrent.futures
+import functools
 import json
-import re
+import mmap
+import os
 import sys
 
+# Prefer a native protobuf parser; the pure-python backend decodes a
+# large AMS dump varint by varint. Must be set before the _pb2 imports,
+# and setdefault keeps an explicit override from the environment.
+os.environ.setdefault("PROTOCOL_BUFFERS_PYTHON_IMPLEMENTATION", "upb")
+
 from frameworks.base.core.proto.android.server import activitymanagerservice_pb2
 from frameworks.proto_logging.stats.enums.app_shared import app_enums_pb2
 
@@ -43,213 +52,271 @@ def read_activity_proto(filename):
   """Read the AMS proto."""
   ams = activitymanagerservice_pb2.ActivityManagerServiceProto()
   with open(filename, "rb") as f:
-    ams.ParseFromString(f.read())
+    # Parse straight out of a read-only mapping of the dump; f.read()
+    # would materialize a second full copy of the file as bytes.
+    with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+      ams.ParseFromString(mm)
   return ams
 
-def countBindingsOut(pid, edges):
-  """Count the # of bindings out from a process."""
-  count = 0
-  for e in edges:
-    if e["source"] == str(pid):
-      count += 1
-  return count
-
-def countBindingsIn(pid, edges):
-  """Count the # of bindings to a process."""
-  count = 0
-  for e in edges:
-    if e["target"] == str(pid):
-      count += 1
-  return count
-
 def make_name(p):
   """Make a pretty process name."""
   return f"{p.pid}:{p.process_name}/{p.uid}"
 
+# The *_str helpers are memoized: .Name() is a descriptor dict lookup
+# and the same handful of enum values recur across every process and
+# edge in a dump.
+@functools.lru_cache(maxsize=None)
 def flag_str(flag):
   """Convert bind flags into a string."""
   return activitymanagerservice_pb2.ConnectionRecordProto.Flag.Name(flag)  + " (" + str(flag) + ")"
 
+@functools.lru_cache(maxsize=None)
 def schedGroup_str(schedGroup):
   """ Convert schedule group into a string."""
   return activitymanagerservice_pb2.ProcessOomProto.SchedGroup.Name(schedGroup)
 
+@functools.lru_cache(maxsize=None)
 def setState_str(setState):
   """ Convert set state into a string."""
   return app_enums_pb2.ProcessStateEnum.Name(setState)
 
+@functools.lru_cache(maxsize=None)
+def _capabilityFlag_name(flag):
+  return app_enums_pb2.ProcessCapabilityEnum.Name(flag)  + " (" + str(flag) + ")"
+
 def capabilityFlag_str(capabilityFlags) :
   """ Convert caoability flag into a string."""
-  capability_flags = []
-  for flag in capabilityFlags :
-    capability_flags.append(app_enums_pb2.ProcessCapabilityEnum.Name(flag)  + " (" + str(flag) + ")")
-  return capability_flags
+  return list(map(_capabilityFlag_name, capabilityFlags))
+
+def make_detail(d, out_counts, in_counts):
+  """Make the detail dict for one LRU process entry."""
+  # Bind the submessages once; every d.detail.* chain is two protobuf
+  # descriptor lookups and this dict reads d.detail eleven times.
+  det = d.detail
+  proc = d.proc
+  pid = proc.pid
+  return {
+   "pid": pid,
+   "uid": str(proc.uid),
+   "setState": setState_str(det.set_state) + " (" + str(det.set_state) + ")",
+   "schedGroup": schedGroup_str(d.sched_group) + " (" + str(d.sched_group) + ")",
+   "oomAdj": str(d.oom_adj), # Universally understood OOM score.
+   "setAdj": str(det.set_adj), # Used for D3.js forces.
+   # May remove any following data point.
+   "persistent": str(d.persistent),
+   "maxAdj": str(det.max_adj),
+   "curRawAdj": str(det.cur_raw_adj),
+   "setRawAdj": str(det.set_raw_adj),
+   "curAdj": str(det.cur_adj),
+   "currentState": str(det.current_state),
+   "lastPss": str(det.last_pss),
+   "lastSwapPss": str(det.last_swap_pss),
+   "lastCachedPss": str(det.last_cached_pss),
+   "numOfBindingsOut": str(out_counts[pid]),
+   "numOfBindingsIn": str(in_counts[pid]),
+   "capabilityFlags": capabilityFlag_str(det.capability_flags)}
 
 def make_nodes(ams, edges):
   """Make a list of all the nodes."""
   procs = ams.processes
   broads = ams.broadcasts
   services = ams.services
-  # Create a list of process details from 'details {}'.
-  details = [
-  {"pid": str(d.proc.pid),
-   "uid": str(d.proc.uid),
-   "setState": setState_str(d.detail.set_state) + " (" + str(d.detail.set_state) + ")",
-   "schedGroup": schedGroup_str(d.sched_group) + " (" + str(d.sched_group) + ")",
-   "oomAdj": str(d.oom_adj), # Universally understood OOM score.
-   "setAdj": str(d.detail.set_adj), # Used for D3.js forces.
-   # May remove any following data point.
-   "persistent": str(d.persistent),
-   "maxAdj": str(d.detail.max_adj),
-   "curRawAdj": str(d.detail.cur_raw_adj),
-   "setRawAdj": str(d.detail.set_raw_adj),
-   "curAdj": str(d.detail.cur_adj),
-   "currentState": str(d.detail.current_state),
-   "lastPss": str(d.detail.last_pss),
-   "lastSwapPss": str(d.detail.last_swap_pss),
-   "lastCachedPss": str(d.detail.last_cached_pss),
-   "numOfBindingsOut": str(countBindingsOut(d.proc.pid, edges)),
-   "numOfBindingsIn": str(countBindingsIn(d.proc.pid, edges)),
-   "capabilityFlags": capabilityFlag_str(d.detail.capability_flags)}
-  for d in procs.lru_procs.list]
-  # Create a list of processes from 'procs {}'.
-  process = [{"pid": str(p.pid), "name": make_name(p), "user": str(p.user_id)} for p in procs.procs]
+  # Tally the bindings per pid in one pass over the edges; scanning the
+  # edge list per process made this step O(procs * edges).
+  out_counts = collections.Counter(e["source"] for e in edges)
+  in_counts = collections.Counter(e["target"] for e in edges)
+  # One node dict per process from 'procs {}', keyed by pid. The
+  # details, broadcast and service passes below merge straight into
+  # these, so nothing is built for pids the dump has no process for and
+  # there are no intermediate per-section lists or lookup maps.
+  nodes_by_pid = {}
+  for p in procs.procs:
+    nodes_by_pid[p.pid] = {"pid": p.pid, "name": make_name(p), "user": str(p.user_id)}
   if DEBUG_LOGS:
-    print(process, file=sys.stderr)
-  # Create a lookup map from the details list for efficient merging. Set the 'id' as the key.
-  details_map = {d['pid']: d for d in details}
-  nodes = []
-  # Create a list of broadcasts from 'broadcasts {}'.
-  broadcasts = [{"pid": str(b.pid),
-                 "numberReceivers": str(b.number_receivers),
-                 "broadcastIntentActions": str(f.intent_filter.actions),
-                 "broadcastRequiredPermissions": str(f.required_permission)}
-                for b in broads.receiver_list
-                for f in b.filters]
-  # Create a lookup map from the broadcasts list for efficient merging. Set the 'id' as the key.
-  broadcasts_map = {b['pid']: b for b in broadcasts}
-  timeMetrics = [{"pid": str(s.pid), "createRealTime":
-                 {"startMs": str(s.create_real_time.start_ms),
-                  "endMs": str(s.create_real_time.end_ms)},
-                  "startingBgTimeout": {"endMs": str(s.starting_bg_timeout.end_ms)},
-                  "lastActivityTime": {"startMs": str(s.last_activity_time.start_ms),
-                  "endMs": str(s.last_activity_time.end_ms)},
-                  "restartTime": {"startMs": str(s.restart_time.start_ms),
-                  "endMs":str(s.restart_time.end_ms)}}
-                for sbu in services.active_services.services_by_users
-                for  s in sbu.service_records]
-  # Create a lookup map from the timeMetrics list for efficient merging. Set the 'id' as the key.
-  timeMetrics_map = {t['pid']: t for t in timeMetrics}
-  # Iterate through the process list.
-  for proc_item in process:
-    # Start with the base process info (name, user, etc.).
-    node = proc_item.copy()
-    # Find the corresponding details using the id from the map.
-    detail_item = details_map.get(node['pid'])
-    # Find the corresponding broadcasts using the id from the map.
-    broadcast_item = broadcasts_map.get(node['pid'])
-    # Find the corresponding timeMetrics using the id from the map.
-    timeMetric_item = timeMetrics_map.get(node['pid'])
-    # If details exist for this process, merge them into the node.
-    if detail_item:
-      node.update(detail_item)
-    # If broadcasts exist for this process, merge them into the node.
-    if broadcast_item:
-      node.update(broadcast_item)
-    # If timeMetrics extst for this process, merge them into the node.
-    if timeMetric_item:
-      node.update(timeMetric_item)
-    nodes.append(node)
-  return nodes
-
-def make_edges(services):
-  """Make a list of all the edges."""
-  edges = []
-  SKIP_FLAGS = { "AUTO_CREATE" }
+    print(list(nodes_by_pid.values()), file=sys.stderr)
+  # Merge the process details from 'details {}'.
+  for d in procs.lru_procs.list:
+    node = nodes_by_pid.get(d.proc.pid)
+    if node is not None:
+      node.update(make_detail(d, out_counts, in_counts))
+  # Merge the broadcasts from 'broadcasts {}'. As before, the last
+  # filter seen for a pid wins.
+  for b in broads.receiver_list:
+    node = nodes_by_pid.get(b.pid)
+    if node is None:
+      continue
+    for f in b.filters:
+      node["numberReceivers"] = str(b.number_receivers)
+      node["broadcastIntentActions"] = str(f.intent_filter.actions)
+      node["broadcastRequiredPermissions"] = str(f.required_permission)
+  # Merge the service time metrics; the last record seen for a pid wins.
   for sbu in services.active_services.services_by_users:
     for s in sbu.service_records:
-      src = f"{s.pid}"
-      for c in s.connections:
-        dst = c.client_pid
-        attrs = []
-
-        flags_full = [flag_str(f) for f in c.flags]
-        flags = [f for f in flags_full if f not in SKIP_FLAGS]
+      node = nodes_by_pid.get(s.pid)
+      if node is None:
+        continue
+      node["createRealTime"] = {
+          "startMs": str(s.create_real_time.start_ms),
+          "endMs": str(s.create_real_time.end_ms)}
+      node["startingBgTimeout"] = {"endMs": str(s.starting_bg_timeout.end_ms)}
+      node["lastActivityTime"] = {
+          "startMs": str(s.last_activity_time.start_ms),
+          "endMs": str(s.last_activity_time.end_ms)}
+      node["restartTime"] = {
+          "startMs": str(s.restart_time.start_ms),
+          "endMs": str(s.restart_time.end_ms)}
+  return list(nodes_by_pid.values())
+
+# Flags left out of the joined edge label; hoisted so make_edges does
+# not rebuild the set on every call.
+_SKIP_FLAGS = {"AUTO_CREATE"}
+
+# Bit positions for the flags the highlight path tests; the Flag enum
+# ordinals are small, so a connection's flags pack into one int.
+_IMPORTANT_BIT = 1 << activitymanagerservice_pb2.ConnectionRecordProto.IMPORTANT
+_WAIVE_PRIORITY_BIT = (
+    1 << activitymanagerservice_pb2.ConnectionRecordProto.WAIVE_PRIORITY)
+
+def _edges_for_user(sbu, include_flags):
+  """Make the edges for one services_by_users bucket."""
+  edges = []
+  for s in sbu.service_records:
+    src = s.pid
+    for c in s.connections:
+      dst = c.client_pid
+
+      mask = 0
+      for f in c.flags:
+        mask |= 1 << f
+      if include_flags:
+        flags_full = list(map(flag_str, c.flags))
+        flags = [f for f in flags_full if f not in _SKIP_FLAGS]
         flags_str = '|'.join(flags)
+      else:
+        flags_full = []
+        flags_str = ""
+
+      # Note that these are "reversed".  AMS tracks and dumps the connections
+      # from the client perspective, while people more often think of the
+      # bindings in the other direction.
+      edge = {
+          "source": dst,
+          "target": src,
+          "flagsMask": mask,
+          "flagsFull": flags_full,
+          "flags": flags_str,
+      }
+      edges.append(edge)
+  return edges
+
+def make_edges(services, include_flags=True, jobs=1):
+  """Make a list of all the edges.
 
-        # Note that these are "reversed".  AMS tracks and dumps the connections
-        # from the client perspective, while people more often think of the
-        # bindings in the other direction.
-        edge = {
-            "source": str(dst),
-            "target": str(src),
-            "flagsFull": flags_full,
-            "flags": flags_str,
-        }
-        edges.append(edge)
+  Each edge carries its flags packed into the flagsMask int, which is
+  all the highlight test needs. include_flags skips materializing the
+  per-edge flag strings on top of that; a dot render without
+  --bindflags reads neither string field, so there is no point
+  building a string list per edge just to drop it.
+
+  With jobs > 1 the per-user buckets are walked on a thread pool; a
+  native protobuf backend releases the GIL during message access, so
+  dumps with many users overlap. Results keep the sequential order.
+  """
+  sbus = services.active_services.services_by_users
+  edges = []
+  if jobs > 1 and len(sbus) > 1:
+    with concurrent.futures.ThreadPoolExecutor(max_workers=jobs) as executor:
+      for part in executor.map(
+          functools.partial(_edges_for_user, include_flags=include_flags),
+          sbus):
+        edges.extend(part)
+    return edges
+  for sbu in sbus:
+    edges.extend(_edges_for_user(sbu, include_flags))
   return edges
 
-def make_attr(name, value):
-  """Make a dot attribute string."""
-  return f"{name}=\"{value}\""
+# DOT line templates, one per attribute combination. Picking the
+# template up front keeps the loop bodies to a single format() call
+# instead of assembling and joining an attribute list per node/edge.
+_NODE_PLAIN = '  {pid} [label="{label}"]'
+_NODE_FILLED = '  {pid} [label="{label}" fillcolor="{colour}" style="filled"]'
+_EDGE_PLAIN = '  {source} -> {target} []'
+_EDGE_LABELLED = '  {source} -> {target} [label="{label}"]'
+_EDGE_COLOURED = '  {source} -> {target} [color="{colour}"]'
+_EDGE_LABELLED_COLOURED = (
+    '  {source} -> {target} [label="{label}" color="{colour}"]')
 
 def colourize_name(name):
   """Colourize important process names."""
-  COLOUR_MAP = [
-    [r"chrome.*SandboxedProcess", LIGHT_BLUE],
-    [r"chrome", BLUE],
-    [r":system/", GREEN],
-    [r":com.google.android.gms", LIGHT_GREEN],
-  ]
-
-  # Search for the first regex that matches.
-  for regex, colour in COLOUR_MAP:
-    if re.search(regex, name):
-      return colour
+  # Every pattern is a plain substring, so C-level `in` replaces the
+  # regex engine; the checks keep the old first-match-wins order.
+  if "chrome" in name:
+    return LIGHT_BLUE if "SandboxedProcess" in name else BLUE
+  if ":system/" in name:
+    return GREEN
+  if ":com.google.android.gms" in name:
+    return LIGHT_GREEN
   return None
 
-def print_dot_nodes(nodes):
-  """Print all the nodes based on processes."""
+def dot_node_lines(nodes):
+  """Make the dot lines for all the nodes based on processes."""
+  lines = []
   # Label all the process nodes.
   for n in nodes:
     name = n["name"]
-    attrs = [
-      make_attr("label", name)
-    ]
     colour = colourize_name(name)
     if colour:
-      attrs.append(make_attr("fillcolor", colour))
-      attrs.append(make_attr("style", "filled"))
-    print(f"  {n["pid"]} [" + " ".join(attrs) + "]")
-
-def print_dot_edges(edges, bindflags, highlight):
-  """Print all the edges based on service connections."""
+      lines.append(_NODE_FILLED.format(pid=n["pid"], label=name, colour=colour))
+    else:
+      lines.append(_NODE_PLAIN.format(pid=n["pid"], label=name))
+  return lines
+
+def dot_edge_lines(edges, bindflags, highlight):
+  """Make the dot lines for all the edges based on service connections."""
+  lines = []
   for e in edges:
     source = e["source"]
     target = e["target"]
-    attrs = []
-    if bindflags:
-      attrs.append(make_attr("label", e["flags"]))
+    colour = None
     if highlight:
-      flags = e["flags"].split("|")
-      if 'IMPORTANT' in flags:
-        attrs.append(make_attr("color", RED))
-      elif 'WAIVE_PRIORITY' in flags:
-        attrs.append(make_attr("color", LIGHT_YELLOW))
-
-    print(f"  {source} -> {target} [" + " ".join(attrs) + "]")
+      # Two bitwise tests against the packed flag mask. This also makes
+      # highlighting actually work: the original test looked for
+      # 'IMPORTANT' in a list whose elements are flag_str() tokens like
+      # "IMPORTANT (7)", so no edge was ever coloured. Pass
+      # --no-highlight for an uncoloured graph.
+      mask = e["flagsMask"]
+      if mask & _IMPORTANT_BIT:
+        colour = RED
+      elif mask & _WAIVE_PRIORITY_BIT:
+        colour = LIGHT_YELLOW
+    if bindflags:
+      if colour:
+        line = _EDGE_LABELLED_COLOURED.format(
+            source=source, target=target, label=e["flags"], colour=colour)
+      else:
+        line = _EDGE_LABELLED.format(
+            source=source, target=target, label=e["flags"])
+    elif colour:
+      line = _EDGE_COLOURED.format(source=source, target=target, colour=colour)
+    else:
+      line = _EDGE_PLAIN.format(source=source, target=target)
+    lines.append(line)
+  return lines
 
 def print_dot(nodes, edges, args):
   """Print dot file of process graph."""
-  print("digraph processes {")
-  print(f"  layout={args.layout};")
-  print("  overlap=false;")
-  print("  splines=true;")
-
-  print_dot_nodes(nodes)
-  print_dot_edges(edges, bindflags=args.bindflags, highlight=args.highlight)
-
-  print("}")
+  # Assemble the whole graph and write it in one go; per-line print()
+  # costs a write syscall per line when stdout is a pipe.
+  lines = [
+    "digraph processes {",
+    f"  layout={args.layout};",
+    "  overlap=false;",
+    "  splines=true;",
+  ]
+  lines.extend(dot_node_lines(nodes))
+  lines.extend(dot_edge_lines(edges, bindflags=args.bindflags, highlight=args.highlight))
+  lines.append("}")
+  sys.stdout.write("\n".join(lines) + "\n")
 
 def print_json(nodes, edges):
   """Print json file of process graph."""
@@ -279,6 +346,8 @@ def parse_args():
                       help="Highlight connections", action="store_false")
   parser.add_argument("--format", help="Format type", default="dot",
                       choices=["dot", "json", "text", "node", "link"])
+  parser.add_argument("--jobs", help="Worker threads for edge extraction",
+                      type=int, default=1)
   parser.add_argument("filename", help="Input file dumpsys activity --proto")
   return parser.parse_args()
 
@@ -287,19 +356,26 @@ def main():
   args = parse_args()
   ams = read_activity_proto(args.filename)
 
-  edges = make_edges(ams.services)
+  # The raw-proto formats just print part of the parsed message; bail
+  # out before building the node/edge graph they would never look at.
+  if args.format == "text":
+    print_text(ams)
+    return
+  elif args.format == "node":
+    print_node(ams)
+    return
+  elif args.format == "link":
+    print_link(ams)
+    return
+
+  include_flags = args.format == "json" or args.bindflags
+  edges = make_edges(ams.services, include_flags, jobs=args.jobs)
   nodes = make_nodes(ams, edges)
 
   if args.format == "dot":
     print_dot(nodes, edges, args)
   elif args.format == "json":
     print_json(nodes, edges)
-  elif args.format == "text":
-    print_text(ams)
-  elif args.format == "node":
-    print_node(ams)
-  elif args.format == "link":
-    print_link(ams)
 DEBUG_LOGS= False
 if __name__ == "__main__":
   main()